@@ -17,6 +17,7 @@ from common.business_logic import (
     get_qualification_data,
     get_high_priority_leads,
     get_lead_summary,
+    load_qualifications,
 )
 
 # Import coffee knowledge base handler
@@ -426,20 +427,11 @@ async def get_qualification_data(qualification_id):
     """
     try:
         # This would typically query a database
-        # For now, we'll use file-based storage
-        import json
-        import os
-        
-        data_file = "sales_qualification_data.json"
-        if os.path.exists(data_file):
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-                qualifications = data.get('qualifications', [])
-                
-                # Find the qualification by ID (using timestamp as ID for now)
-                for qual in qualifications:
-                    if qual.get('timestamp') == qualification_id:
-                        return qual
+        # For now, we'll use the file-backed records kept by business_logic
+        # Find the qualification by ID (using timestamp as ID for now)
+        for qual in load_qualifications():
+            if qual.get('timestamp') == qualification_id:
+                return qual
         
         return None
         
@@ -1,5 +1,7 @@
 import asyncio
 import json
+import os
+import threading
 from datetime import datetime, timedelta
 import random
 from common.config import ARTIFICIAL_DELAY, MOCK_DATA_SIZE
@@ -639,8 +641,9 @@ async def handle_meeting_scheduling_request(customer_identifier, identifier_type
         return {"error": "Customer not found", "customer": None, "available_slots": []}
     
     # Step 2: Check availability (next 7 days)
-    start_date = datetime.now().isoformat()
-    end_date = (datetime.now() + timedelta(days=7)).isoformat()
+    now = datetime.now()
+    start_date = now.isoformat()
+    end_date = (now + timedelta(days=7)).isoformat()
     
     availability_result = await get_available_appointment_slots(start_date, end_date)
     
@@ -831,6 +834,87 @@ def refresh_sample_data():
         return False
 
 
+# Sales Qualification Storage
+# Records are appended one JSON object per line, so storing a lead never rewrites earlier ones
+SALES_DATA_FILE = "sales_qualification_data.ndjson"
+LEGACY_SALES_DATA_FILE = "sales_qualification_data.json"
+
+_qualifications = None  # In-memory copy of the stored records
+_qualifications_signature = None  # (size, mtime) of the data file when it was last read
+_qualifications_lock = threading.Lock()
+
+
+def _qualifications_file_signature():
+    """Size and modification time of the data file, or None if it does not exist"""
+    try:
+        stat = os.stat(SALES_DATA_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_qualifications_file():
+    """Read stored records, migrating the legacy single-document JSON file if needed"""
+    if os.path.exists(SALES_DATA_FILE):
+        records = []
+        with open(SALES_DATA_FILE, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+        return records
+    
+    if os.path.exists(LEGACY_SALES_DATA_FILE):
+        with open(LEGACY_SALES_DATA_FILE, 'r') as f:
+            records = json.load(f).get('qualifications', [])
+        with open(SALES_DATA_FILE, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record, separators=(',', ':')) + "\n")
+        return records
+    
+    return []
+
+
+def _refresh_qualifications():
+    """Re-read the data file if it changed since it was last read (caller holds the lock)"""
+    global _qualifications, _qualifications_signature
+    signature = _qualifications_file_signature()
+    if _qualifications is None or signature != _qualifications_signature:
+        _qualifications = _read_qualifications_file()
+        _qualifications_signature = _qualifications_file_signature()
+    return _qualifications
+
+
+def load_qualifications():
+    """
+    Return all stored qualification records. The data file is only re-read when its
+    size or modification time changed, e.g. after another worker process appended a lead.
+    """
+    with _qualifications_lock:
+        return _refresh_qualifications()
+
+
+def append_qualification(record):
+    """
+    Append one qualification record to the data file and the in-memory copy.
+    """
+    global _qualifications, _qualifications_signature
+    line = json.dumps(record, separators=(',', ':')) + "\n"
+    with _qualifications_lock:
+        records = _refresh_qualifications()
+        size_before = _qualifications_signature[0] if _qualifications_signature else 0
+        with open(SALES_DATA_FILE, 'a') as f:
+            f.write(line)
+        signature = _qualifications_file_signature()
+        if signature and signature[0] == size_before + len(line.encode('utf-8')):
+            # Only this record was added: keep the in-memory copy in step with the file
+            records.append(record)
+            _qualifications_signature = signature
+        else:
+            # Another process wrote to the file too; re-read it on the next load
+            _qualifications = None
+
+
 # Sales Qualification Business Logic
 def calculate_lead_score(qualification_data):
     """
@@ -887,18 +971,6 @@ async def store_qualification_data(qualification_data):
     Store qualification data in the sales qualification data file.
     """
     try:
-        data_file = "sales_qualification_data.json"
-        
-        # Load existing data
-        try:
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            data = {
-                "qualifications": [],
-                "last_updated": datetime.now().isoformat()
-            }
-        
         # Calculate lead score and priority
         lead_score = calculate_lead_score(qualification_data)
         qualification_data["lead_score"] = lead_score
@@ -910,13 +982,8 @@ async def store_qualification_data(qualification_data):
         else:
             qualification_data["priority"] = "LOW"
         
-        # Add new qualification data
-        data["qualifications"].append(qualification_data)
-        data["last_updated"] = datetime.now().isoformat()
-        
-        # Save updated data
-        with open(data_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Append the new record; earlier records are not rewritten
+        append_qualification(qualification_data)
         
         return {
             "success": True,
@@ -938,17 +1005,8 @@ async def get_qualification_data(qualification_id):
     Retrieve qualification data by ID.
     """
     try:
-        data_file = "sales_qualification_data.json"
-        
-        # Load existing data
-        try:
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            return None
-        
         # Find the qualification data by ID
-        for entry in data.get('qualifications', []):
+        for entry in load_qualifications():
             if entry.get('id') == qualification_id:
                 return entry
         
@@ -963,18 +1021,9 @@ async def get_high_priority_leads():
     Get all high-priority leads for sales team follow-up.
     """
     try:
-        data_file = "sales_qualification_data.json"
-        
-        # Load existing data
-        try:
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            return []
-        
         # Filter high-priority leads
         high_priority_leads = [
-            lead for lead in data.get('qualifications', [])
+            lead for lead in load_qualifications()
             if lead.get('priority') == 'HIGH'
         ]
         
@@ -992,16 +1041,7 @@ async def get_lead_summary():
     Get a summary of all leads with counts by priority.
     """
     try:
-        data_file = "sales_qualification_data.json"
-        
-        # Load existing data
-        try:
-            with open(data_file, 'r') as f:
-                data = json.load(f)
-        except FileNotFoundError:
-            return {"total": 0, "high": 0, "medium": 0, "low": 0}
-        
-        leads = data.get('qualifications', [])
+        leads = load_qualifications()
         
         summary = {
             "total": len(leads),
@@ -1069,16 +1109,11 @@ async def get_qualification_summary():
     Get a summary of all stored qualification data.
     """
     try:
-        data_file = "sales_qualification_data.json"
-        
-        with open(data_file, 'r') as f:
-            data = json.load(f)
-        
-        qualifications = data.get('qualifications', [])
+        qualifications = load_qualifications()
         
         summary = {
             "total_qualifications": len(qualifications),
-            "last_updated": data.get('last_updated'),
+            "last_updated": qualifications[-1].get('timestamp') if qualifications else None,
             "qualifications": []
         }
         
@@ -1,3 +1,5 @@
+import os
+
 ARTIFICIAL_DELAY = {
     "database": 0.0,
     "external_api": 0.0, # Not in use in this reference implementation but left as an example for simulating different delays
@@ -17,4 +19,26 @@ MOCK_DATA_SIZE = {
 DATABASE_CONFIG = {
     "path": "business_data.db",
     "enable": False  # Set to True to use actual SQLite instead of mock data
-} 
\ No newline at end of file
+}
+
+
+# Semantic response cache for the knowledge chatbot (see common/semantic_cache.py)
+SEMANTIC_CACHE_CONFIG = {
+    "enable": os.getenv("ENABLE_SEMANTIC_CACHE", "false").lower() == "true",
+    "path": os.getenv("SEMANTIC_CACHE_FILE", "semantic_cache.db"),
+    "embedding_model": "text-embedding-3-small",
+    "similarity_threshold": 0.93,  # Minimum cosine similarity for a cache hit
+    "min_jaccard": 0.5,  # Minimum content-word overlap for a cache hit
+    "max_entries": 1000,
+    "ttl_seconds": 86400  # Cached replies expire after a day
+}
+
+
+# Embedding search over the knowledge base (see common/semantic_index.py)
+KNOWLEDGE_EMBEDDING_CONFIG = {
+    "enable": os.getenv("ENABLE_EMBEDDING_SEARCH", "false").lower() == "true",
+    "path": os.getenv("KNOWLEDGE_EMBEDDINGS_FILE", "knowledge_embeddings.db"),
+    "embedding_model": "text-embedding-3-small",
+    "batch_size": 256,  # Entries per embeddings request
+    "min_similarity": 0.3  # Minimum cosine similarity for a search result
+}
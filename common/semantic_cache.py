@@ -0,0 +1,189 @@
+"""
+Semantic response cache for the knowledge chatbot.
+
+Paraphrased repeats of a question ("How do I improve sales?" / "How can I
+boost my sales?") asked from the same conversation state are answered from a
+previously generated reply instead of another chat completion round-trip.
+Only a conversation's opening question is cached: later replies depend on
+earlier turns (names, business details) that must not leak into another
+session. Cached replies expire, and are keyed on the knowledge base version
+so edits to the knowledge base are never answered from stale replies.
+"""
+
+import re
+import math
+import time
+import operator
+import sqlite3
+import hashlib
+import threading
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+# Words that signal customer-specific or stateful requests (orders, appointments,
+# lead capture). Replies to these depend on live data and are never cached.
+FUNCTION_INTENT_WORDS = frozenset({
+    'order', 'orders', 'appointment', 'appointments', 'schedule', 'reschedule',
+    'cancel', 'book', 'booking', 'meeting', 'account', 'phone', 'email',
+    'name', 'status', 'contact', 'quote',
+})
+
+# Function calls whose results only depend on the static knowledge base
+CACHEABLE_FUNCTIONS = frozenset({
+    'search_coffee_knowledge',
+    'get_similar_knowledge',
+    'search_by_topic',
+    'get_available_topics',
+    'get_knowledge_entry',
+})
+
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'to', 'of', 'for', 'in', 'on', 'is', 'are',
+    'do', 'does', 'how', 'what', 'can', 'should', 'with', 'about', 'best',
+    'i', 'my', 'me', 'we', 'our', 'you', 'your',
+})
+
+
+def cache_state_key(history: Sequence[Any], summary: Optional[str], knowledge_version: str) -> Optional[str]:
+    """Cache key for the next reply, or None if it depends on the conversation so far
+    
+    Only opening questions are cacheable: no earlier user message and no summary of one.
+    (The greeting is the only message before that and carries no user context.)
+    """
+    if summary or any(getattr(message, 'type', None) == 'human' for message in history):
+        return None
+    return hashlib.sha1(f"opening\0{knowledge_version}".encode('utf-8')).hexdigest()
+
+
+def content_tokens(text: str) -> frozenset:
+    """Lowercased content words used for the lexical overlap check"""
+    return frozenset(word for word in _TOKEN_RE.findall(text.lower()) if word not in _STOP_WORDS)
+
+
+class SemanticResponseCache:
+    """Embedding-similarity cache of chat replies, persisted to SQLite"""
+
+    def __init__(self, api_key: str, db_path: str = "semantic_cache.db",
+                 model: str = "text-embedding-3-small", similarity_threshold: float = 0.93,
+                 min_jaccard: float = 0.5, max_entries: int = 1000, ttl_seconds: float = 86400):
+        from langchain_openai import OpenAIEmbeddings
+
+        self.embeddings = OpenAIEmbeddings(model=model, openai_api_key=api_key)
+        self.similarity_threshold = similarity_threshold
+        self.min_jaccard = min_jaccard
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+
+        # Re-embedding the same text within a process is avoided entirely
+        self._embed = lru_cache(maxsize=2048)(self._embed_uncached)
+
+        # state hash -> [(normalized embedding, content tokens, response, row id, timestamp)]
+        self._entries: Dict[str, List[Tuple[array, frozenset, str, int, float]]] = {}
+        self._size = 0
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                state_hash TEXT NOT NULL,
+                message TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                function_name TEXT,
+                timestamp REAL NOT NULL
+            )"""
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        """Drop expired replies and load the most recent remaining ones into memory"""
+        self._db.execute("DELETE FROM responses WHERE timestamp < ?", (time.time() - self.ttl_seconds,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT id, state_hash, message, embedding, response, timestamp FROM responses "
+            "ORDER BY id DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for row_id, state_hash, message, blob, response, timestamp in reversed(rows):
+            vector = array('f')
+            vector.frombytes(blob)
+            self._add(state_hash, vector, content_tokens(message), response, row_id, timestamp)
+
+    def _add(self, state_hash: str, vector: array, tokens: frozenset, response: str, row_id: int,
+             timestamp: float):
+        self._entries.setdefault(state_hash, []).append((vector, tokens, response, row_id, timestamp))
+        self._size += 1
+        if self._size > self.max_entries:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        oldest_hash, oldest_index, oldest_id = None, -1, None
+        for state_hash, bucket in self._entries.items():
+            if bucket and (oldest_id is None or bucket[0][3] < oldest_id):
+                oldest_hash, oldest_index, oldest_id = state_hash, 0, bucket[0][3]
+        if oldest_hash is None:
+            return
+        del self._entries[oldest_hash][oldest_index]
+        if not self._entries[oldest_hash]:
+            del self._entries[oldest_hash]
+        self._size -= 1
+        self._db.execute("DELETE FROM responses WHERE id = ?", (oldest_id,))
+
+    def _embed_uncached(self, text: str) -> array:
+        vector = self.embeddings.embed_query(text)
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return array('f', (value / norm for value in vector))
+
+    @staticmethod
+    def is_cacheable_message(message: str) -> bool:
+        """Cheap keyword gate: skip messages that look like customer-specific requests"""
+        return FUNCTION_INTENT_WORDS.isdisjoint(_TOKEN_RE.findall(message.lower()))
+
+    def lookup(self, message: str, state_hash: Optional[str]) -> Optional[str]:
+        """Return an unexpired cached reply for a paraphrase of message asked in the same state"""
+        if state_hash is None or not self.is_cacheable_message(message):
+            return None
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            bucket = [entry for entry in self._entries.get(state_hash, ()) if entry[4] >= cutoff]
+        if not bucket:
+            return None
+
+        vector = self._embed(message)
+        tokens = content_tokens(message)
+        best_score, best_response, best_tokens = 0.0, None, frozenset()
+        for cached_vector, cached_tokens, response, _, _ in bucket:
+            score = sum(map(operator.mul, vector, cached_vector))
+            if score > best_score:
+                best_score, best_response, best_tokens = score, response, cached_tokens
+
+        if best_response is None or best_score <= self.similarity_threshold:
+            return None
+
+        # Guard against near-identical embeddings for different intents
+        union = tokens | best_tokens
+        if union and len(tokens & best_tokens) / len(union) <= self.min_jaccard:
+            return None
+        return best_response
+
+    def store(self, message: str, state_hash: Optional[str], response: str, function_name: Optional[str] = None):
+        """Remember a reply generated for message in the given conversation state"""
+        if state_hash is None or not self.is_cacheable_message(message):
+            return
+        if function_name is not None and function_name not in CACHEABLE_FUNCTIONS:
+            return
+
+        vector = self._embed(message)
+        timestamp = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO responses (state_hash, message, embedding, response, function_name, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (state_hash, message, vector.tobytes(), response, function_name, timestamp)
+            )
+            self._add(state_hash, vector, content_tokens(message), response, cursor.lastrowid, timestamp)
+            self._db.commit()
@@ -0,0 +1,104 @@
+"""
+Embedding index over the knowledge base entries.
+
+Entries are embedded once (title + content) and the vectors are persisted to
+SQLite keyed by a hash of the embedded text, so restarts and knowledge base
+refreshes only embed entries that actually changed. Queries are matched by
+cosine similarity against the in-memory vectors.
+"""
+
+import math
+import heapq
+import operator
+import sqlite3
+import hashlib
+import threading
+from array import array
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+
+class KnowledgeEmbeddingIndex:
+    """Cosine-similarity index of knowledge base entries, persisted to SQLite"""
+
+    def __init__(self, api_key: str, db_path: str = "knowledge_embeddings.db",
+                 model: str = "text-embedding-3-small", batch_size: int = 256):
+        from langchain_openai import OpenAIEmbeddings
+
+        self.embeddings = OpenAIEmbeddings(model=model, openai_api_key=api_key, chunk_size=batch_size)
+        self.model = model
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+
+        # Repeated queries are embedded only once per process
+        self._embed_query = lru_cache(maxsize=1024)(self._embed_query_uncached)
+
+        # Parallel lists: entry id and its normalized embedding
+        self._ids: List[str] = []
+        self._vectors: List[array] = []
+        self._entries_key = None  # (id, mtime) of the entries the index was built from
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                text_hash TEXT PRIMARY KEY,
+                embedding BLOB NOT NULL
+            )"""
+        )
+        self._db.commit()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> array:
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return array('f', (value / norm for value in vector))
+
+    def _embed_query_uncached(self, text: str) -> array:
+        return self._normalize(self.embeddings.embed_query(text))
+
+    def _entry_text(self, entry: Dict[str, Any]) -> str:
+        return f"{entry.get('title', '')}\n\n{entry.get('content_raw', '')}"
+
+    def _text_hash(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model}\0{text}".encode('utf-8')).hexdigest()
+
+    def build(self, entries: List[Dict[str, Any]]):
+        """(Re)build the index for entries, embedding only texts not seen before"""
+        entries_key = tuple((entry['id'], entry.get('_mtime_ns')) for entry in entries)
+        with self._lock:
+            if entries_key == self._entries_key:
+                return
+
+            hashes = [self._text_hash(self._entry_text(entry)) for entry in entries]
+            stored = {}
+            for text_hash, blob in self._db.execute("SELECT text_hash, embedding FROM embeddings"):
+                vector = array('f')
+                vector.frombytes(blob)
+                stored[text_hash] = vector
+
+            missing = [(text_hash, entry) for text_hash, entry in zip(hashes, entries) if text_hash not in stored]
+            for start in range(0, len(missing), self.batch_size):
+                batch = missing[start:start + self.batch_size]
+                vectors = self.embeddings.embed_documents([self._entry_text(entry) for _, entry in batch])
+                for (text_hash, _), vector in zip(batch, vectors):
+                    stored[text_hash] = self._normalize(vector)
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (text_hash, embedding) VALUES (?, ?)",
+                        (text_hash, stored[text_hash].tobytes())
+                    )
+            self._db.commit()
+
+            self._ids = [entry['id'] for entry in entries]
+            self._vectors = [stored[text_hash] for text_hash in hashes]
+            self._entries_key = entries_key
+
+    def search(self, query: str, max_results: int = 5, min_similarity: float = 0.0) -> List[Tuple[str, float]]:
+        """Return (entry id, cosine similarity) pairs for the entries closest to query"""
+        with self._lock:
+            ids, vectors = self._ids, self._vectors
+        if not ids or max_results <= 0:
+            return []
+
+        query_vector = self._embed_query(query)
+        scores = [sum(map(operator.mul, query_vector, vector)) for vector in vectors]
+        top_indices = heapq.nlargest(max_results, range(len(ids)), key=scores.__getitem__)
+        return [(ids[i], scores[i]) for i in top_indices if scores[i] >= min_similarity]
@@ -7,20 +7,254 @@ Optimized for accuracy with semantic search, relevance scoring, and improved mat
 import os
 import re
 import json
+import time
+import heapq
+import pickle
+import hashlib
+import threading
 import yaml
 import markdown
-from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Any, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import List, Dict, Optional, Any, Tuple, Mapping, FrozenSet
 from collections import Counter
+from dataclasses import dataclass, field, fields
+from functools import lru_cache
 import math
 
+# Prefer the libyaml-backed loader for frontmatter; fall back to pure Python
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+_WORD_RE = re.compile(r'\b\w+\b')
+_FRONTMATTER_END_RE = re.compile(r'^[^\S\n]*---[^\S\n]*$', re.MULTILINE)
+
+# Upper bound on threads used to read/parse MDX files on a cache refresh
+MAX_PARSE_WORKERS = 8
+
+# Parsed entries and search features persisted between runs. Stored under DATA_DIRECTORY
+# (overridable with KNOWLEDGE_CACHE_FILE), not next to the MDX files, which may be read-only
+DISK_CACHE_FILENAME = "knowledge_cache.pkl"
+# The cache is keyed on a fingerprint of this module's source (see _parser_fingerprint), so
+# parser changes invalidate it automatically. Bump this for changes the fingerprint cannot
+# see, e.g. a yaml or markdown upgrade that changes parse output.
+DISK_CACHE_VERSION = 1
+
+# Characters of raw content kept in the precomputed search result preview
+CONTENT_PREVIEW_LENGTH = 200
+
+# Priority mappings for specific queries (query keyword -> ordered MDX files)
+PRIORITY_MAPPINGS: Dict[str, List[str]] = {
+    # Company & Introduction
+    'company': ['01-company-introduction.mdx'],
+    'introduction': ['01-company-introduction.mdx'],
+    'about': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
+    'founders': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
+    'abbotsford': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
+    'logan': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
+    'karl': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
+    
+    # Coffee Strategies
+    'strategy': ['02-strategy-one-elevate-coffee-game.mdx', '09-strategy-four-coffee-menu-design.mdx', '10-strategy-five-grow-your-brand.mdx'],
+    'elevate': ['02-strategy-one-elevate-coffee-game.mdx'],
+    'menu design': ['09-strategy-four-coffee-menu-design.mdx'],
+    'menu': ['09-strategy-four-coffee-menu-design.mdx', '17-playbook-tip-simple-menu.mdx'],
+    'brand': ['10-strategy-five-grow-your-brand.mdx'],
+    'white label': ['10-strategy-five-grow-your-brand.mdx'],
+    'white labeling': ['10-strategy-five-grow-your-brand.mdx'],
+    
+    # Coffee Basics
+    'specialty coffee': ['04-specialty-coffee-journey.mdx', '01-company-introduction.mdx'],
+    'coffee journey': ['04-specialty-coffee-journey.mdx'],
+    'bean to cup': ['04-specialty-coffee-journey.mdx'],
+    'origins': ['05-origin-beans-flavor-profile.mdx'],
+    'flavor': ['05-origin-beans-flavor-profile.mdx'],
+    'ethiopian': ['05-origin-beans-flavor-profile.mdx'],
+    'kenyan': ['05-origin-beans-flavor-profile.mdx'],
+    'storage': ['06-ordering-storing-coffee-fresh.mdx'],
+    'freshness': ['06-ordering-storing-coffee-fresh.mdx'],
+    'roaster': ['07-pick-perfect-roaster.mdx'],
+    'roasting': ['07-pick-perfect-roaster.mdx'],
+    
+    # Case Studies
+    'case study': ['08-case-study-fracpacks.mdx'],
+    'fracpacks': ['08-case-study-fracpacks.mdx'],
+    'packaging': ['08-case-study-fracpacks.mdx'],
+    'cost savings': ['08-case-study-fracpacks.mdx'],
+    
+    # Operations & Efficiency
+    'efficiency': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
+    'workflow': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
+    'optimization': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
+    'skipper': ['14-successful-coffee-program-skipper.mdx'],
+    'leadership': ['14-successful-coffee-program-skipper.mdx', '21-how-design-your-team.mdx'],
+    'calibration': ['15-difference-good-great-coffee-calibration.mdx'],
+    'quality': ['15-difference-good-great-coffee-calibration.mdx'],
+    'consistency': ['15-difference-good-great-coffee-calibration.mdx'],
+    
+    # Equipment
+    'espresso machine': ['16-espresso-machine-heartbeat.mdx'],
+    'equipment': ['16-espresso-machine-heartbeat.mdx', '12-for-restaurants-groups-chains.mdx'],
+    'machine': ['16-espresso-machine-heartbeat.mdx'],
+    'maintenance': ['16-espresso-machine-heartbeat.mdx'],
+    
+    # Menu & Service
+    'simple menu': ['17-playbook-tip-simple-menu.mdx'],
+    'profitability': ['17-playbook-tip-simple-menu.mdx', '22-sales-improvement-strategies.mdx'],
+    'service': ['17-playbook-tip-simple-menu.mdx'],
+    
+    # Events & Launch
+    'playbook': ['18-specialty-coffee-playbook-launch.mdx', '01-company-introduction.mdx'],
+    'coffee fest': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
+    'nyc': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
+    'launch': ['18-specialty-coffee-playbook-launch.mdx'],
+    'event': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
+    
+    # Partnership & Philosophy
+    'partnership': ['20-we-dont-push-brand-wrap-around-yours.mdx', '12-for-restaurants-groups-chains.mdx'],
+    'philosophy': ['20-we-dont-push-brand-wrap-around-yours.mdx'],
+    'collaboration': ['20-we-dont-push-brand-wrap-around-yours.mdx'],
+    'support': ['20-we-dont-push-brand-wrap-around-yours.mdx', '11-about-founders-company.mdx'],
+    
+    # Team & Culture
+    'team': ['21-how-design-your-team.mdx', '11-about-founders-company.mdx'],
+    'culture': ['21-how-design-your-team.mdx'],
+    'hiring': ['21-how-design-your-team.mdx'],
+    
+    # Enterprise Services
+    'restaurants': ['12-for-restaurants-groups-chains.mdx'],
+    'chains': ['12-for-restaurants-groups-chains.mdx'],
+    'groups': ['12-for-restaurants-groups-chains.mdx'],
+    'enterprise': ['12-for-restaurants-groups-chains.mdx'],
+    'pricing': ['23-pricing-strategies-profit-optimization.mdx', '12-for-restaurants-groups-chains.mdx'],
+    'volume': ['12-for-restaurants-groups-chains.mdx'],
+    
+    # Learning & Education
+    'learn': ['03-what-you-will-learn.mdx'],
+    'learning': ['03-what-you-will-learn.mdx'],
+    'education': ['03-what-you-will-learn.mdx'],
+    'chapter': ['03-what-you-will-learn.mdx'],
+    
+    # Sales & Revenue Improvement
+    'sales': ['22-sales-improvement-strategies.mdx', '09-strategy-four-coffee-menu-design.mdx'],
+    'revenue': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
+    'profit': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
+    'upselling': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
+    'upsell': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
+    'margin': ['23-pricing-strategies-profit-optimization.mdx', '22-sales-improvement-strategies.mdx'],
+    'anchor pricing': ['23-pricing-strategies-profit-optimization.mdx'],
+    'menu psychology': ['22-sales-improvement-strategies.mdx', '09-strategy-four-coffee-menu-design.mdx'],
+    
+    # Customer Experience & Retention
+    'customer experience': ['24-customer-experience-retention.mdx', '22-sales-improvement-strategies.mdx'],
+    'retention': ['24-customer-experience-retention.mdx'],
+    'loyalty': ['24-customer-experience-retention.mdx', '10-strategy-five-grow-your-brand.mdx'],
+    'customer satisfaction': ['24-customer-experience-retention.mdx'],
+    'repeat business': ['24-customer-experience-retention.mdx', '22-sales-improvement-strategies.mdx'],
+    'brand loyalty': ['24-customer-experience-retention.mdx', '10-strategy-five-grow-your-brand.mdx'],
+    
+    # Operational Efficiency & Sales
+    'throughput': ['25-operational-efficiency-sales.mdx'],
+    'productivity': ['25-operational-efficiency-sales.mdx'],
+    'cost reduction': ['25-operational-efficiency-sales.mdx', '23-pricing-strategies-profit-optimization.mdx'],
+    'operational': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx']
+}
+
+# Common words ignored when extracting entry keywords
+STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
+    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
+    'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those',
+    'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them', 'my', 'your', 'his', 'its', 'our', 'their'
+})
+
+# Semantic relationships for the coffee industry (group -> related keywords)
+SEMANTIC_GROUPS: Mapping[str, FrozenSet[str]] = MappingProxyType({
+    'coffee_quality': frozenset({'quality', 'excellent', 'premium', 'specialty', 'artisan', 'gourmet', 'taste', 'flavor', 'aroma'}),
+    'business_operations': frozenset({'operations', 'efficiency', 'workflow', 'process', 'management', 'optimization', 'productivity'}),
+    'sales_revenue': frozenset({'sales', 'revenue', 'profit', 'pricing', 'upselling', 'margin', 'earnings', 'growth', 'increase'}),
+    'customer_service': frozenset({'customer', 'service', 'experience', 'satisfaction', 'loyalty', 'retention', 'support'}),
+    'equipment_technical': frozenset({'equipment', 'machine', 'espresso', 'grinder', 'brewer', 'maintenance', 'calibration', 'technical'}),
+    'menu_design': frozenset({'menu', 'design', 'layout', 'psychology', 'pricing', 'presentation', 'visual'}),
+    'training_education': frozenset({'training', 'education', 'learning', 'teaching', 'barista', 'staff', 'skills'}),
+    'branding_marketing': frozenset({'brand', 'branding', 'marketing', 'white label', 'private label', 'identity', 'promotion'}),
+    'roasting_processing': frozenset({'roasting', 'roast', 'processing', 'beans', 'origins', 'farm', 'green beans'}),
+    'storage_freshness': frozenset({'storage', 'freshness', 'shelf life', 'preservation', 'timing', 'temperature'})
+})
+
+@dataclass
+class Corpus:
+    """Column-oriented search features for the cached entries, indexed by position (see id_to_idx)"""
+    id_to_idx: Dict[str, int] = field(default_factory=dict)
+    postings: Dict[str, List[Tuple[int, float]]] = field(default_factory=dict)  # word -> [(doc_idx, field weight)]
+    content_lower: List[str] = field(default_factory=list)
+    semantic_counts: List[Dict[str, int]] = field(default_factory=list)
+    keyword_vocab: Dict[str, int] = field(default_factory=dict)  # keyword -> bit index
+    keyword_masks: List[int] = field(default_factory=list)  # bitset over keyword_vocab
+    
+    @classmethod
+    def from_entries(cls, entries: List[Dict[str, Any]]) -> 'Corpus':
+        """Precompute the lowercased text, term postings and keyword bitsets used by relevance scoring"""
+        corpus = cls()
+        for entry in entries:
+            title = (entry.get('title') or '').lower()
+            topic = (entry.get('topic') or '').lower()
+            tags = [tag.lower() for tag in entry.get('tags') or []]
+            content = (entry.get('content_raw') or '').lower()
+            
+            # Title (10), topic (8), each tag (6) and content (2) add their weight once per
+            # distinct word; posting lists let a query only touch entries containing its words
+            doc_idx = len(corpus.content_lower)
+            term_weights = Counter()
+            for text, weight in [(title, 10.0), (topic, 8.0), *((tag, 6.0) for tag in tags), (content, 2.0)]:
+                for word in set(_WORD_RE.findall(text)):
+                    term_weights[word] += weight
+            for word, weight in term_weights.items():
+                corpus.postings.setdefault(word, []).append((doc_idx, weight))
+            
+            corpus.id_to_idx[entry['id']] = doc_idx
+            corpus.content_lower.append(content)
+            corpus.semantic_counts.append(cls._scan_entry(f"{title} {topic} {' '.join(tags)} {content}"))
+            
+            keyword_mask = 0
+            for keyword in entry.get('keywords', []):
+                bit = corpus.keyword_vocab.setdefault(keyword, len(corpus.keyword_vocab))
+                keyword_mask |= 1 << bit
+            corpus.keyword_masks.append(keyword_mask)
+        return corpus
+    
+    @staticmethod
+    def _scan_entry(entry_text: str) -> Dict[str, int]:
+        """Count how many keywords of each semantic group occur in an entry's text"""
+        return {
+            group_name: sum(1 for keyword in keywords if keyword in entry_text)
+            for group_name, keywords in SEMANTIC_GROUPS.items()
+        }
+
+@dataclass
+class KnowledgeSnapshot:
+    """Entries and the corpus built from them. A refresh publishes a new snapshot as a
+    whole; published snapshots (and their entries) are never modified"""
+    entries: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # entry id -> entry, in corpus order
+    corpus: Corpus = field(default_factory=Corpus)
+    version: str = ""  # changes whenever an entry is added, removed or edited
+    loaded_at: float = 0.0  # time.monotonic() of the refresh
+
 class EnhancedCoffeeKnowledgeBase:
-    def __init__(self, mdx_directory: str = "knowledge"):
+    def __init__(self, mdx_directory: str = "knowledge", cache_path: Optional[str] = None):
         self.mdx_directory = Path(mdx_directory)
         self.mdx_directory.mkdir(parents=True, exist_ok=True)
-        self._cache = {}  # Cache for parsed entries
-        self._last_cache_update = None
+        self.cache_path = Path(
+            cache_path
+            or os.getenv("KNOWLEDGE_CACHE_FILE")
+            or os.path.join(os.getenv("DATA_DIRECTORY", "data"), DISK_CACHE_FILENAME)
+        )
+        self._snapshot: Optional[KnowledgeSnapshot] = None  # Parsed entries and search corpus
+        self._refresh_lock = threading.Lock()  # One refresh at a time; readers never wait on it
+        self._html_cache = {}  # entry id -> rendered HTML, filled lazily by get_html()
     
     def _get_mdx_files(self) -> List[Path]:
         """Get all MDX files in the knowledge base directory"""
@@ -47,17 +281,22 @@ class EnhancedCoffeeKnowledgeBase:
                 'filepath': str(file_path)
             }
             
-            # Get content (both raw and HTML)
+            # Raw content only; HTML is rendered on demand by get_html()
             content_raw = markdown_content
-            content_html = markdown.markdown(content_raw)
             
             # Extract keywords for better matching
             keywords = self._extract_keywords(content_raw, metadata)
             
+            # Preview shown in search results, built once per parse instead of per query
+            if len(content_raw) > CONTENT_PREVIEW_LENGTH:
+                content_preview = content_raw[:CONTENT_PREVIEW_LENGTH] + "..."
+            else:
+                content_preview = content_raw
+            
             return {
                 **metadata,
                 'content_raw': content_raw,
-                'content_html': content_html,
+                'content_preview': content_preview,
                 'keywords': keywords
             }
         except Exception as e:
@@ -70,18 +309,10 @@ class EnhancedCoffeeKnowledgeBase:
         text = f"{metadata.get('title', '')} {metadata.get('topic', '')} {' '.join(metadata.get('tags', []))} {content}"
         
         # Convert to lowercase and split into words
-        words = re.findall(r'\b\w+\b', text.lower())
-        
-        # Filter out common stop words
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by',
-            'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did',
-            'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can', 'this', 'that', 'these', 'those',
-            'i', 'you', 'he', 'she', 'it', 'we', 'they', 'me', 'him', 'her', 'us', 'them', 'my', 'your', 'his', 'her', 'its', 'our', 'their'
-        }
+        words = _WORD_RE.findall(text.lower())
         
         # Filter and count words
-        filtered_words = [word for word in words if len(word) > 2 and word not in stop_words]
+        filtered_words = [word for word in words if len(word) > 2 and word not in STOP_WORDS]
         word_counts = Counter(filtered_words)
         
         # Return top keywords (most frequent and relevant)
@@ -92,157 +323,229 @@ class EnhancedCoffeeKnowledgeBase:
         if not content.startswith('---'):
             return {}, content
         
-        lines = content.split('\n')
-        if len(lines) < 2:
+        first_newline = content.find('\n')
+        if first_newline == -1:
             return {}, content
         
-        end_index = -1
-        for i, line in enumerate(lines[1:], 1):
-            if line.strip() == '---':
-                end_index = i
-                break
-        
-        if end_index == -1:
+        # Locate the closing '---' line and slice the original string around it
+        closing = _FRONTMATTER_END_RE.search(content, first_newline + 1)
+        if not closing:
             return {}, content
         
-        frontmatter_text = '\n'.join(lines[1:end_index])
-        markdown_content = '\n'.join(lines[end_index + 1:])
+        frontmatter_text = content[first_newline + 1:max(closing.start() - 1, first_newline + 1)]
+        markdown_content = content[closing.end() + 1:]
         
         try:
-            frontmatter_data = yaml.safe_load(frontmatter_text) or {}
+            frontmatter_data = yaml.load(frontmatter_text, Loader=_YamlLoader) or {}
         except yaml.YAMLError:
             frontmatter_data = {}
         
         return frontmatter_data, markdown_content
     
-    def _get_entries_cached(self) -> List[Dict[str, Any]]:
-        """Get entries with caching for better performance"""
-        current_time = datetime.now()
-        
-        # Check if cache is still valid (5 minutes)
-        if (self._last_cache_update and 
-            (current_time - self._last_cache_update).seconds < 300 and 
-            self._cache):
-            return list(self._cache.values())
+    def _load_disk_cache(self) -> Tuple[Dict[str, Dict[str, Any]], Optional['Corpus']]:
+        """Load entries and corpus saved by a previous run; empty if missing or unreadable"""
+        try:
+            with open(self.cache_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('fingerprint') == _parser_fingerprint():
+                return data['entries'], data['corpus']
+        except Exception:
+            pass
+        return {}, None
+    
+    def _save_disk_cache(self, snapshot: KnowledgeSnapshot):
+        """Persist parsed entries and corpus so the next process start can skip parsing"""
+        cache_path = self.cache_path
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'fingerprint': _parser_fingerprint(), 'entries': snapshot.entries, 'corpus': snapshot.corpus},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            print(f"Could not write knowledge base cache: {e}")
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+    
+    @staticmethod
+    def _snapshot_is_fresh(snapshot: Optional[KnowledgeSnapshot]) -> bool:
+        """Whether the snapshot is still valid (refreshed within the last 5 minutes)"""
+        return bool(snapshot and snapshot.entries and time.monotonic() - snapshot.loaded_at < 300)
+    
+    def _get_snapshot(self) -> KnowledgeSnapshot:
+        """Current entries and corpus, refreshing them if they are stale
         
-        # Refresh cache
+        Callers take the snapshot once per operation, so entries and corpus always match
+        even if another thread publishes a refresh meanwhile.
+        """
+        snapshot = self._snapshot
+        if self._snapshot_is_fresh(snapshot):
+            return snapshot
+        with self._refresh_lock:
+            snapshot = self._snapshot
+            if not self._snapshot_is_fresh(snapshot):
+                snapshot = self._build_snapshot(snapshot)
+                self._snapshot = snapshot
+            return snapshot
+    
+    def _build_snapshot(self, previous: Optional[KnowledgeSnapshot]) -> KnowledgeSnapshot:
+        """Build a new snapshot, re-parsing only files that changed since previous"""
         mdx_files = self._get_mdx_files()
-        self._cache = {}
+        if previous is None:
+            # First load in this process: start from the previous run's parse, if any
+            previous_entries, previous_corpus = self._load_disk_cache()
+        else:
+            previous_entries, previous_corpus = previous.entries, previous.corpus
         
+        file_states = []
+        stale_files = []
         for file_path in mdx_files:
-            entry = self._parse_mdx_file(file_path)
-            if entry:
-                self._cache[entry['id']] = entry
+            try:
+                mtime_ns = file_path.stat().st_mtime_ns
+            except OSError:
+                continue
+            file_states.append((file_path, mtime_ns))
+            entry = previous_entries.get(file_path.stem)
+            if not entry or entry.get('_mtime_ns') != mtime_ns or entry.get('filepath') != str(file_path):
+                stale_files.append(file_path)
         
-        self._last_cache_update = current_time
-        return list(self._cache.values())
-    
-    def _calculate_relevance_score(self, query: str, entry: Dict[str, Any]) -> float:
-        """Calculate relevance score for an entry based on query"""
-        query_lower = query.lower()
-        query_words = set(re.findall(r'\b\w+\b', query_lower))
+        # Read and parse changed files concurrently so file I/O overlaps
+        parsed = {}
+        if len(stale_files) > 1:
+            workers = min(MAX_PARSE_WORKERS, len(stale_files))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for file_path, entry in zip(stale_files, executor.map(self._parse_mdx_file, stale_files)):
+                    parsed[file_path] = entry
+        else:
+            for file_path in stale_files:
+                parsed[file_path] = self._parse_mdx_file(file_path)
         
-        score = 0.0
+        entries = {}
+        for file_path, mtime_ns in file_states:
+            if file_path in parsed:
+                entry = parsed[file_path]
+                if not entry:
+                    continue
+                entry['_mtime_ns'] = mtime_ns
+            else:
+                entry = previous_entries[file_path.stem]
+            entries[entry['id']] = entry
         
-        # Title match (highest weight)
-        title_words = set(re.findall(r'\b\w+\b', entry.get('title', '').lower()))
-        title_matches = len(query_words.intersection(title_words))
-        score += title_matches * 10.0
+        # Drop rendered HTML for entries that were re-parsed or removed
+        html_cache = self._html_cache.copy()
+        self._html_cache = {
+            entry_id: html for entry_id, html in html_cache.items()
+            if entry_id in entries and entries[entry_id] is previous_entries.get(entry_id)
+        }
         
-        # Topic match (high weight)
-        topic_words = set(re.findall(r'\b\w+\b', entry.get('topic', '').lower()))
-        topic_matches = len(query_words.intersection(topic_words))
-        score += topic_matches * 8.0
+        version = hashlib.sha1(
+            "\0".join(f"{entry_id}:{entry.get('_mtime_ns')}" for entry_id, entry in entries.items()).encode('utf-8')
+        ).hexdigest()
         
-        # Tags match (medium-high weight)
-        tag_matches = 0
-        for tag in entry.get('tags', []):
-            tag_words = set(re.findall(r'\b\w+\b', tag.lower()))
-            tag_matches += len(query_words.intersection(tag_words))
-        score += tag_matches * 6.0
+        # The corpus only needs rebuilding when an entry was re-parsed, added or removed
+        unchanged = not stale_files and list(entries) == list(previous_entries)
+        if unchanged and previous_corpus is not None:
+            return KnowledgeSnapshot(entries, previous_corpus, version, time.monotonic())
         
-        # Content match (medium weight)
-        content_words = set(re.findall(r'\b\w+\b', entry.get('content_raw', '').lower()))
-        content_matches = len(query_words.intersection(content_words))
-        score += content_matches * 2.0
+        snapshot = KnowledgeSnapshot(entries, Corpus.from_entries(list(entries.values())), version, time.monotonic())
+        self._save_disk_cache(snapshot)
+        return snapshot
+    
+    def _get_entries_cached(self) -> List[Dict[str, Any]]:
+        """Get entries with caching for better performance"""
+        return list(self._get_snapshot().entries.values())
+    
+    def _calculate_relevance_score(self, corpus: Corpus, query_lower: str, term_score: float,
+                                   query_bigrams: List[str], keyword_match_mask: int,
+                                   doc_idx: int) -> float:
+        """Calculate relevance score for the entry at doc_idx based on the tokenized query"""
+        content_lower = corpus.content_lower[doc_idx]
+        
+        # Title, topic, tags and content word matches (accumulated from the postings)
+        score = term_score
         
-        # Keywords match (medium weight)
-        keyword_matches = 0
-        for keyword in entry.get('keywords', []):
-            if any(word in keyword.lower() for word in query_words):
-                keyword_matches += 1
+        # Keywords match (medium weight): entry keywords among those matching the query
+        keyword_matches = bin(keyword_match_mask & corpus.keyword_masks[doc_idx]).count('1')
         score += keyword_matches * 4.0
         
         # Exact phrase match bonus
-        if query_lower in entry.get('content_raw', '').lower():
+        if query_lower in content_lower:
             score += 15.0
         
-        # Partial phrase match bonus
-        query_phrases = query_lower.split()
-        for i in range(len(query_phrases) - 1):
-            phrase = ' '.join(query_phrases[i:i+2])
-            if phrase in entry.get('content_raw', '').lower():
+        # Partial phrase match bonus. Substring checks run against the content lowercased
+        # once at cache build; for the few bigrams in a query they are faster than a
+        # compiled regex alternation, which re has to try at every position
+        for phrase in query_bigrams:
+            if phrase in content_lower:
                 score += 8.0
         
         return score
     
-    def _semantic_search(self, query: str, entries: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], float]]:
-        """Perform semantic search with relevance scoring"""
-        query_lower = query.lower()
-        query_words = set(re.findall(r'\b\w+\b', query_lower))
+    def _semantic_search(self, corpus: Corpus, query_lower: str, query_words: frozenset,
+                         entries: List[Dict[str, Any]], max_results: int, min_score: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        """Perform semantic search and return the top-scoring entries above min_score"""
+        if max_results <= 0 or not entries:
+            return []
         
-        # Define semantic relationships for coffee industry
-        semantic_groups = {
-            'coffee_quality': ['quality', 'excellent', 'premium', 'specialty', 'artisan', 'gourmet', 'taste', 'flavor', 'aroma'],
-            'business_operations': ['operations', 'efficiency', 'workflow', 'process', 'management', 'optimization', 'productivity'],
-            'sales_revenue': ['sales', 'revenue', 'profit', 'pricing', 'upselling', 'margin', 'earnings', 'growth', 'increase'],
-            'customer_service': ['customer', 'service', 'experience', 'satisfaction', 'loyalty', 'retention', 'support'],
-            'equipment_technical': ['equipment', 'machine', 'espresso', 'grinder', 'brewer', 'maintenance', 'calibration', 'technical'],
-            'menu_design': ['menu', 'design', 'layout', 'psychology', 'pricing', 'presentation', 'visual'],
-            'training_education': ['training', 'education', 'learning', 'teaching', 'barista', 'staff', 'skills'],
-            'branding_marketing': ['brand', 'branding', 'marketing', 'white label', 'private label', 'identity', 'promotion'],
-            'roasting_processing': ['roasting', 'roast', 'processing', 'beans', 'origins', 'farm', 'green beans'],
-            'storage_freshness': ['storage', 'freshness', 'shelf life', 'preservation', 'timing', 'temperature']
-        }
+        # Adjacent word pairs for the partial phrase bonus, built once per query
+        query_tokens = query_lower.split()
+        query_bigrams = [' '.join(query_tokens[i:i+2]) for i in range(len(query_tokens) - 1)]
+        
+        # Keywords containing any query word, resolved once over the whole keyword vocabulary
+        keyword_match_mask = 0
+        for keyword, bit in corpus.keyword_vocab.items():
+            if any(word in keyword for word in query_words):
+                keyword_match_mask |= 1 << bit
+        
+        # Field-weighted word matches, accumulated per doc_idx from the query words' postings
+        term_scores = [0.0] * len(corpus.content_lower)
+        for word in query_words:
+            for doc_idx, weight in corpus.postings.get(word, ()):
+                term_scores[doc_idx] += weight
         
         # Find relevant semantic groups
         relevant_groups = []
-        for group_name, keywords in semantic_groups.items():
-            if any(keyword in query_words for keyword in keywords):
+        for group_name, keywords in SEMANTIC_GROUPS.items():
+            if not keywords.isdisjoint(query_words):
                 relevant_groups.append(group_name)
         
-        # Calculate enhanced relevance scores
-        scored_entries = []
-        for entry in entries:
-            base_score = self._calculate_relevance_score(query, entry)
-            
-            # Semantic group bonus
+        # Calculate enhanced relevance scores, indexed by position in entries
+        scores = [0.0] * len(entries)
+        for idx, entry in enumerate(entries):
+            doc_idx = corpus.id_to_idx[entry['id']]
+            base_score = self._calculate_relevance_score(
+                corpus, query_lower, term_scores[doc_idx], query_bigrams, keyword_match_mask, doc_idx
+            )
+            
+            # Semantic group bonus (keyword counts per group are precomputed per entry)
             semantic_bonus = 0
-            entry_text = f"{entry.get('title', '')} {entry.get('topic', '')} {' '.join(entry.get('tags', []))} {entry.get('content_raw', '')}".lower()
+            group_counts = corpus.semantic_counts[doc_idx]
             
-            for group_name, keywords in semantic_groups.items():
-                if group_name in relevant_groups:
-                    group_matches = sum(1 for keyword in keywords if keyword in entry_text)
-                    semantic_bonus += group_matches * 2.0
+            for group_name in relevant_groups:
+                semantic_bonus += group_counts[group_name] * 2.0
             
-            final_score = base_score + semantic_bonus
-            scored_entries.append((entry, final_score))
+            scores[idx] = base_score + semantic_bonus
         
-        # Sort by relevance score (descending)
-        scored_entries.sort(key=lambda x: x[1], reverse=True)
+        # Partial top-k selection instead of sorting every entry (ties keep input order)
+        top_indices = heapq.nlargest(max_results, range(len(entries)), key=scores.__getitem__)
         
-        return scored_entries
+        return [(entries[i], scores[i]) for i in top_indices if scores[i] >= min_score]
     
     def search_knowledge_base(self, query: str, max_results: int = 10, min_score: float = 1.0) -> List[Dict[str, Any]]:
         """Enhanced search with accuracy optimization"""
         try:
-            entries = self._get_entries_cached()
+            snapshot = self._get_snapshot()
+            entries = list(snapshot.entries.values())
             if not entries:
                 return []
             
             query_lower = query.lower().strip()
             if not query_lower:
                 return []
+            query_words = frozenset(_WORD_RE.findall(query_lower))
             
             # First, check for exact priority matches
             priority_mappings = self._get_priority_mappings()
@@ -270,23 +573,26 @@ class EnhancedCoffeeKnowledgeBase:
                 # Sort by priority order
                 priority_entries.sort(key=lambda x: x[1], reverse=True)
                 
+                # Priority matches alone fill the result set; skip semantic scoring
+                if len(priority_entries) >= max_results:
+                    return [entry for entry, score in priority_entries[:max_results]]
+                
                 # Add remaining entries using semantic search
                 remaining_entries = [entry for entry in entries if entry.get('filename') not in priority_files]
                 if remaining_entries:
-                    semantic_results = self._semantic_search(query, remaining_entries)
-                    # Filter out low-scoring results
-                    semantic_results = [(entry, score) for entry, score in semantic_results if score >= min_score]
-                    priority_entries.extend(semantic_results[:max_results - len(priority_entries)])
+                    semantic_results = self._semantic_search(
+                        snapshot.corpus, query_lower, query_words, remaining_entries, max_results - len(priority_entries), min_score
+                    )
+                    priority_entries.extend(semantic_results)
                 
                 return [entry for entry, score in priority_entries[:max_results]]
             
-            # No priority matches, use semantic search
-            semantic_results = self._semantic_search(query, entries)
-            
-            # Filter by minimum score and limit results
-            filtered_results = [(entry, score) for entry, score in semantic_results if score >= min_score]
+            # No priority matches, use semantic search (already filtered and limited)
+            semantic_results = self._semantic_search(
+                snapshot.corpus, query_lower, query_words, entries, max_results, min_score
+            )
             
-            return [entry for entry, score in filtered_results[:max_results]]
+            return [entry for entry, score in semantic_results]
             
         except Exception as e:
             print(f"Error searching knowledge base: {e}")
@@ -294,143 +600,30 @@ class EnhancedCoffeeKnowledgeBase:
     
     def _get_priority_mappings(self) -> Dict[str, List[str]]:
         """Get priority mappings for specific queries"""
-        return {
-            # Company & Introduction
-            'company': ['01-company-introduction.mdx'],
-            'introduction': ['01-company-introduction.mdx'],
-            'about': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
-            'founders': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
-            'abbotsford': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
-            'logan': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
-            'karl': ['01-company-introduction.mdx', '11-about-founders-company.mdx'],
-            
-            # Coffee Strategies
-            'strategy': ['02-strategy-one-elevate-coffee-game.mdx', '09-strategy-four-coffee-menu-design.mdx', '10-strategy-five-grow-your-brand.mdx'],
-            'elevate': ['02-strategy-one-elevate-coffee-game.mdx'],
-            'menu design': ['09-strategy-four-coffee-menu-design.mdx'],
-            'menu': ['09-strategy-four-coffee-menu-design.mdx', '17-playbook-tip-simple-menu.mdx'],
-            'brand': ['10-strategy-five-grow-your-brand.mdx'],
-            'white label': ['10-strategy-five-grow-your-brand.mdx'],
-            'white labeling': ['10-strategy-five-grow-your-brand.mdx'],
-            
-            # Coffee Basics
-            'specialty coffee': ['04-specialty-coffee-journey.mdx', '01-company-introduction.mdx'],
-            'coffee journey': ['04-specialty-coffee-journey.mdx'],
-            'bean to cup': ['04-specialty-coffee-journey.mdx'],
-            'origins': ['05-origin-beans-flavor-profile.mdx'],
-            'flavor': ['05-origin-beans-flavor-profile.mdx'],
-            'ethiopian': ['05-origin-beans-flavor-profile.mdx'],
-            'kenyan': ['05-origin-beans-flavor-profile.mdx'],
-            'storage': ['06-ordering-storing-coffee-fresh.mdx'],
-            'freshness': ['06-ordering-storing-coffee-fresh.mdx'],
-            'roaster': ['07-pick-perfect-roaster.mdx'],
-            'roasting': ['07-pick-perfect-roaster.mdx'],
-            
-            # Case Studies
-            'case study': ['08-case-study-fracpacks.mdx'],
-            'fracpacks': ['08-case-study-fracpacks.mdx'],
-            'packaging': ['08-case-study-fracpacks.mdx'],
-            'cost savings': ['08-case-study-fracpacks.mdx'],
-            
-            # Operations & Efficiency
-            'efficiency': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
-            'workflow': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
-            'optimization': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx'],
-            'skipper': ['14-successful-coffee-program-skipper.mdx'],
-            'leadership': ['14-successful-coffee-program-skipper.mdx', '21-how-design-your-team.mdx'],
-            'calibration': ['15-difference-good-great-coffee-calibration.mdx'],
-            'quality': ['15-difference-good-great-coffee-calibration.mdx'],
-            'consistency': ['15-difference-good-great-coffee-calibration.mdx'],
-            
-            # Equipment
-            'espresso machine': ['16-espresso-machine-heartbeat.mdx'],
-            'equipment': ['16-espresso-machine-heartbeat.mdx', '12-for-restaurants-groups-chains.mdx'],
-            'machine': ['16-espresso-machine-heartbeat.mdx'],
-            'maintenance': ['16-espresso-machine-heartbeat.mdx'],
-            
-            # Menu & Service
-            'simple menu': ['17-playbook-tip-simple-menu.mdx'],
-            'profitability': ['17-playbook-tip-simple-menu.mdx', '22-sales-improvement-strategies.mdx'],
-            'service': ['17-playbook-tip-simple-menu.mdx'],
-            
-            # Events & Launch
-            'playbook': ['18-specialty-coffee-playbook-launch.mdx', '01-company-introduction.mdx'],
-            'coffee fest': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
-            'nyc': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
-            'launch': ['18-specialty-coffee-playbook-launch.mdx'],
-            'event': ['18-specialty-coffee-playbook-launch.mdx', '19-coffee-fest-nyc-coming-hot.mdx'],
-            
-            # Partnership & Philosophy
-            'partnership': ['20-we-dont-push-brand-wrap-around-yours.mdx', '12-for-restaurants-groups-chains.mdx'],
-            'philosophy': ['20-we-dont-push-brand-wrap-around-yours.mdx'],
-            'collaboration': ['20-we-dont-push-brand-wrap-around-yours.mdx'],
-            'support': ['20-we-dont-push-brand-wrap-around-yours.mdx', '11-about-founders-company.mdx'],
-            
-            # Team & Culture
-            'team': ['21-how-design-your-team.mdx', '11-about-founders-company.mdx'],
-            'culture': ['21-how-design-your-team.mdx'],
-            'hiring': ['21-how-design-your-team.mdx'],
-            
-            # Enterprise Services
-            'restaurants': ['12-for-restaurants-groups-chains.mdx'],
-            'chains': ['12-for-restaurants-groups-chains.mdx'],
-            'groups': ['12-for-restaurants-groups-chains.mdx'],
-            'enterprise': ['12-for-restaurants-groups-chains.mdx'],
-            'pricing': ['23-pricing-strategies-profit-optimization.mdx', '12-for-restaurants-groups-chains.mdx'],
-            'volume': ['12-for-restaurants-groups-chains.mdx'],
-            
-            # Learning & Education
-            'learn': ['03-what-you-will-learn.mdx'],
-            'learning': ['03-what-you-will-learn.mdx'],
-            'education': ['03-what-you-will-learn.mdx'],
-            'chapter': ['03-what-you-will-learn.mdx'],
-            
-            # Sales & Revenue Improvement
-            'sales': ['22-sales-improvement-strategies.mdx', '09-strategy-four-coffee-menu-design.mdx'],
-            'revenue': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
-            'profit': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
-            'upselling': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
-            'upsell': ['22-sales-improvement-strategies.mdx', '23-pricing-strategies-profit-optimization.mdx'],
-            'margin': ['23-pricing-strategies-profit-optimization.mdx', '22-sales-improvement-strategies.mdx'],
-            'anchor pricing': ['23-pricing-strategies-profit-optimization.mdx'],
-            'menu psychology': ['22-sales-improvement-strategies.mdx', '09-strategy-four-coffee-menu-design.mdx'],
-            
-            # Customer Experience & Retention
-            'customer experience': ['24-customer-experience-retention.mdx', '22-sales-improvement-strategies.mdx'],
-            'retention': ['24-customer-experience-retention.mdx'],
-            'loyalty': ['24-customer-experience-retention.mdx', '10-strategy-five-grow-your-brand.mdx'],
-            'customer satisfaction': ['24-customer-experience-retention.mdx'],
-            'repeat business': ['24-customer-experience-retention.mdx', '22-sales-improvement-strategies.mdx'],
-            'brand loyalty': ['24-customer-experience-retention.mdx', '10-strategy-five-grow-your-brand.mdx'],
-            
-            # Operational Efficiency & Sales
-            'throughput': ['25-operational-efficiency-sales.mdx'],
-            'productivity': ['25-operational-efficiency-sales.mdx'],
-            'cost reduction': ['25-operational-efficiency-sales.mdx', '23-pricing-strategies-profit-optimization.mdx'],
-            'operational': ['25-operational-efficiency-sales.mdx', '13-30-second-fix-profit-win.mdx']
-        }
+        return PRIORITY_MAPPINGS
     
     def get_similar_entries(self, entry_id: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """Find similar entries based on content similarity"""
         try:
-            entries = self._get_entries_cached()
-            target_entry = next((e for e in entries if e['id'] == entry_id), None)
+            snapshot = self._get_snapshot()
+            target_entry = snapshot.entries.get(entry_id)
             
             if not target_entry:
                 return []
             
             # Calculate similarity scores
             similar_entries = []
-            target_keywords = set(target_entry.get('keywords', []))
+            id_to_idx = snapshot.corpus.id_to_idx
+            keyword_masks = snapshot.corpus.keyword_masks
+            target_mask = keyword_masks[id_to_idx[entry_id]]
             target_topic = target_entry.get('topic', '')
             
-            for entry in entries:
+            for entry in snapshot.entries.values():
                 if entry['id'] == entry_id:
                     continue
                 
-                # Calculate keyword overlap
-                entry_keywords = set(entry.get('keywords', []))
-                keyword_overlap = len(target_keywords.intersection(entry_keywords))
+                # Calculate keyword overlap as the popcount of the shared keyword bits
+                keyword_overlap = bin(target_mask & keyword_masks[id_to_idx[entry['id']]]).count('1')
                 
                 # Topic similarity
                 topic_similarity = 1.0 if entry.get('topic') == target_topic else 0.0
@@ -452,12 +645,26 @@ class EnhancedCoffeeKnowledgeBase:
     def get_entry_by_id(self, entry_id: str) -> Optional[Dict[str, Any]]:
         """Get a specific entry by ID with caching"""
         try:
-            entries = self._get_entries_cached()
-            return self._cache.get(entry_id)
+            return self._get_snapshot().entries.get(entry_id)
         except Exception as e:
             print(f"Error getting entry {entry_id}: {e}")
             return None
     
+    def get_html(self, entry_id: str) -> Optional[str]:
+        """Get an entry's content rendered as HTML, rendering it on first request"""
+        try:
+            entry = self.get_entry_by_id(entry_id)
+            if not entry:
+                return None
+            html = self._html_cache.get(entry_id)
+            if html is None:
+                html = markdown.markdown(entry['content_raw'])
+                self._html_cache[entry_id] = html
+            return html
+        except Exception as e:
+            print(f"Error rendering entry {entry_id}: {e}")
+            return None
+    
     def get_topics(self) -> List[str]:
         """Get all unique topics in the knowledge base"""
         try:
@@ -495,6 +702,14 @@ class EnhancedCoffeeKnowledgeBase:
             print(f"Error searching by topic: {e}")
             return []
     
+    def get_entry_count(self) -> int:
+        """Number of entries in the knowledge base, without copying the entry list"""
+        return len(self._get_snapshot().entries)
+    
+    def get_version(self) -> str:
+        """Identifier of the current knowledge base contents; changes when any entry changes"""
+        return self._get_snapshot().version
+    
     def search_by_tag(self, tag: str, max_results: int = 10) -> List[Dict[str, Any]]:
         """Search entries by specific tag"""
         try:
@@ -505,6 +720,21 @@ class EnhancedCoffeeKnowledgeBase:
             print(f"Error searching by tag: {e}")
             return []
 
+@lru_cache(maxsize=None)
+def _parser_fingerprint() -> str:
+    """Hash of the code and constants that shape cached entries and corpus (this module's
+    source); a cache written by a different parser is ignored rather than loaded"""
+    digest = hashlib.sha1(str(DISK_CACHE_VERSION).encode())
+    try:
+        digest.update(Path(__file__).read_bytes())
+    except OSError:
+        # Source unavailable (e.g. bytecode-only install): hash the parsing constants and bytecode
+        digest.update(repr((CONTENT_PREVIEW_LENGTH, sorted(STOP_WORDS), [f.name for f in fields(Corpus)])).encode())
+        for function in (EnhancedCoffeeKnowledgeBase._parse_mdx_file, EnhancedCoffeeKnowledgeBase._parse_frontmatter,
+                         EnhancedCoffeeKnowledgeBase._extract_keywords, Corpus.from_entries.__func__):
+            digest.update(function.__code__.co_code)
+    return digest.hexdigest()
+
 # Example usage and testing
 if __name__ == "__main__":
     # Initialize the enhanced coffee knowledge base
@@ -4,11 +4,21 @@ import os
 import sys
 import json
 import time
+import asyncio
+import inspect
+import functools
+import threading
+import concurrent.futures
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Tuple
 
 # Import agent functions for sales qualification
 from common.agent_functions import FUNCTION_MAP
+from common.agent_templates import AgentTemplates
+from common.business_logic import SALES_DATA_FILE, load_qualifications, append_qualification
+from common.config import SEMANTIC_CACHE_CONFIG, KNOWLEDGE_EMBEDDING_CONFIG
+from common.semantic_cache import SemanticResponseCache, cache_state_key
+from common.semantic_index import KnowledgeEmbeddingIndex
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, AIMessage, SystemMessage
@@ -17,6 +27,187 @@ from openai import OpenAIError, RateLimitError, APIError, AuthenticationError
 # Import our enhanced knowledge base
 from knowledge.enhanced_coffee_knowledge_handler import EnhancedCoffeeKnowledgeBase
 
+# Upper bound on in-flight chat model requests per event loop
+MAX_CONCURRENT_LLM_REQUESTS = 10
+
+# Messages that end a chat session (compared lowercased and stripped)
+EXIT_COMMANDS = frozenset({'quit', 'exit', 'bye', 'q'})
+
+# Retries (with the client's exponential backoff, honouring Retry-After) on rate limits and
+# transient API errors, so bursts of turns slow down instead of failing
+MAX_LLM_RETRIES = 5
+
+
+def _compact_json(data) -> str:
+    """Serialize a function result for the follow-up prompt without indentation whitespace"""
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+# Function calling schema for knowledge base operations, built once at import
+FUNCTION_SCHEMAS: Tuple[Dict[str, Any], ...] = (
+    {
+        "name": "search_coffee_knowledge",
+        "description": "Search the coffee knowledge base for relevant information about coffee business, strategies, equipment, sales, and operations",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The search query to find relevant coffee knowledge"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of results to return (default: 5)",
+                    "default": 5
+                },
+                "min_score": {
+                    "type": "number",
+                    "description": "Minimum relevance score for results (default: 1.0)",
+                    "default": 1.0
+                }
+            },
+            "required": ["query"]
+        }
+    },
+    {
+        "name": "get_similar_knowledge",
+        "description": "Find similar knowledge entries based on a specific topic or entry",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "entry_id": {
+                    "type": "string",
+                    "description": "The ID of the entry to find similar content for"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of similar results to return (default: 3)",
+                    "default": 3
+                }
+            },
+            "required": ["entry_id"]
+        }
+    },
+    {
+        "name": "search_by_topic",
+        "description": "Search knowledge base entries by specific topic",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "topic": {
+                    "type": "string",
+                    "description": "The topic to search for (e.g., 'Sales & Revenue', 'Menu Design', 'Equipment')"
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of results to return (default: 5)",
+                    "default": 5
+                }
+            },
+            "required": ["topic"]
+        }
+    },
+    {
+        "name": "get_available_topics",
+        "description": "Get all available topics in the knowledge base",
+        "parameters": {
+            "type": "object",
+            "properties": {}
+        }
+    },
+    {
+        "name": "get_knowledge_entry",
+        "description": "Get a specific knowledge entry by its ID",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "entry_id": {
+                    "type": "string",
+                    "description": "The ID of the knowledge entry to retrieve"
+                }
+            },
+            "required": ["entry_id"]
+        }
+    },
+    {
+        "name": "extract_qualification_data",
+        "description": "Extract business qualification data from conversation",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "business_type": {
+                    "type": "string",
+                    "description": "Type of business: new_cafe, existing_business, or unknown"
+                },
+                "timeline": {
+                    "type": "string",
+                    "description": "When opening/switching (e.g., '2 weeks', 'next month', 'soon')"
+                },
+                "pain_points": {
+                    "type": "string",
+                    "description": "Current supplier issues or business challenges"
+                },
+                "business_scale": {
+                    "type": "string",
+                    "description": "Number of locations or business size"
+                },
+                "coffee_style": {
+                    "type": "string",
+                    "description": "Coffee preference (specialty, dark, consistent, etc.)"
+                },
+                "equipment_needs": {
+                    "type": "string",
+                    "description": "What equipment they need"
+                },
+                "volume": {
+                    "type": "string",
+                    "description": "Expected daily coffee volume"
+                },
+                "support_needs": {
+                    "type": "string",
+                    "description": "Training, service, menu help needed"
+                },
+                "contact_name": {
+                    "type": "string",
+                    "description": "Person's name"
+                },
+                "contact_phone": {
+                    "type": "string",
+                    "description": "Phone number"
+                },
+                "contact_email": {
+                    "type": "string",
+                    "description": "Email address"
+                },
+                "contact_role": {
+                    "type": "string",
+                    "description": "Their role/title"
+                }
+            },
+            "required": ["business_type"]
+        }
+    },
+    {
+        "name": "generate_sales_handoff",
+        "description": "Generate professional sales handoff summary",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "collected_data": {
+                    "type": "object",
+                    "description": "All collected qualification data"
+                },
+                "conversation_summary": {
+                    "type": "string",
+                    "description": "Brief summary of key conversation points"
+                }
+            },
+            "required": ["collected_data", "conversation_summary"]
+        }
+    }
+)
+
+
 class KnowledgeBasedChatBot:
     """Chatbot with integrated coffee knowledge base using function calling"""
     
@@ -39,472 +230,499 @@ class KnowledgeBasedChatBot:
         self.chat_model = ChatOpenAI(
             model="gpt-3.5-turbo",
             temperature=0.7,
-            openai_api_key=self.api_key
+            openai_api_key=self.api_key,
+            max_retries=MAX_LLM_RETRIES
         )
         
-        # Store conversation history
+        # Build the prompt template and its system message once, not on every turn
+        self.agent_templates = AgentTemplates(industry="coffee_business")
+        self._system_message = SystemMessage(content=self.agent_templates.prompt)
+        
+        # Store conversation history (bounded; older turns are folded into a summary)
         self.conversation_history = []
+        self._max_history_messages = int(os.getenv("MAX_HISTORY_MESSAGES", "20"))
+        self._summary: Optional[str] = None
+        
+        # Created lazily on the event loop that first uses it
+        self._llm_semaphore = None
+        self._llm_semaphore_loop = None
+        
+        # Long-lived workers: a thread pool for blocking function calls and a background
+        # event loop for async agent functions, instead of creating them per call
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        self._bg_loop = asyncio.new_event_loop()
+        self._bg_loop_thread = threading.Thread(target=self._bg_loop.run_forever, name="agent-functions-loop", daemon=True)
+        self._bg_loop_thread.start()
+        
+        # Optional semantic cache of replies to paraphrased repeat questions
+        self.response_cache = None
+        if SEMANTIC_CACHE_CONFIG["enable"]:
+            try:
+                self.response_cache = SemanticResponseCache(
+                    api_key=self.api_key,
+                    db_path=SEMANTIC_CACHE_CONFIG["path"],
+                    model=SEMANTIC_CACHE_CONFIG["embedding_model"],
+                    similarity_threshold=SEMANTIC_CACHE_CONFIG["similarity_threshold"],
+                    min_jaccard=SEMANTIC_CACHE_CONFIG["min_jaccard"],
+                    max_entries=SEMANTIC_CACHE_CONFIG["max_entries"],
+                    ttl_seconds=SEMANTIC_CACHE_CONFIG["ttl_seconds"]
+                )
+            except Exception as e:
+                print(f"⚠️ Semantic cache disabled: {e}")
+        
+        # Optional embedding index used by search_coffee_knowledge instead of keyword scoring
+        self.embedding_index = None
+        if KNOWLEDGE_EMBEDDING_CONFIG["enable"]:
+            try:
+                self.embedding_index = KnowledgeEmbeddingIndex(
+                    api_key=self.api_key,
+                    db_path=KNOWLEDGE_EMBEDDING_CONFIG["path"],
+                    model=KNOWLEDGE_EMBEDDING_CONFIG["embedding_model"],
+                    batch_size=KNOWLEDGE_EMBEDDING_CONFIG["batch_size"]
+                )
+            except Exception as e:
+                self.embedding_index = None
+                print(f"⚠️ Embedding search disabled: {e}")
         
         # Initialize data storage for qualification data
-        self.data_file = "sales_qualification_data.json"
+        self.data_file = SALES_DATA_FILE
         self.load_stored_data()
         
         
-        # Define function calling schema
+        # Define function calling schema and bind it to the model once; subclasses that
+        # extend self.functions in place are picked up by the same binding
         self.functions = self._define_functions()
+        self._function_model = self.chat_model.bind(functions=self.functions, function_call="auto")
+        self._function_dispatch = self._build_function_dispatch()
         
         print("✅ Knowledge-based chatbot initialized")
-        print(f"📚 Knowledge base loaded with {len(self.knowledge_base._get_entries_cached())} entries")
+        print(f"📚 Knowledge base loaded with {self.knowledge_base.get_entry_count()} entries")
+        
+        # Embed the loaded entries in the background so it overlaps the greeting round-trip
+        self._embedding_index_ready = threading.Event()
+        if self.embedding_index:
+            threading.Thread(target=self._build_embedding_index, name="knowledge-embedding", daemon=True).start()
+        else:
+            self._embedding_index_ready.set()
     
     def _define_functions(self) -> List[Dict[str, Any]]:
         """Define function calling schema for knowledge base operations"""
-        return [
-            {
-                "name": "search_coffee_knowledge",
-                "description": "Search the coffee knowledge base for relevant information about coffee business, strategies, equipment, sales, and operations",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "The search query to find relevant coffee knowledge"
-                        },
-                        "max_results": {
-                            "type": "integer",
-                            "description": "Maximum number of results to return (default: 5)",
-                            "default": 5
-                        },
-                        "min_score": {
-                            "type": "number",
-                            "description": "Minimum relevance score for results (default: 1.0)",
-                            "default": 1.0
-                        }
-                    },
-                    "required": ["query"]
-                }
-            },
-            {
-                "name": "get_similar_knowledge",
-                "description": "Find similar knowledge entries based on a specific topic or entry",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "entry_id": {
-                            "type": "string",
-                            "description": "The ID of the entry to find similar content for"
-                        },
-                        "max_results": {
-                            "type": "integer",
-                            "description": "Maximum number of similar results to return (default: 3)",
-                            "default": 3
-                        }
-                    },
-                    "required": ["entry_id"]
-                }
-            },
-            {
-                "name": "search_by_topic",
-                "description": "Search knowledge base entries by specific topic",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "topic": {
-                            "type": "string",
-                            "description": "The topic to search for (e.g., 'Sales & Revenue', 'Menu Design', 'Equipment')"
-                        },
-                        "max_results": {
-                            "type": "integer",
-                            "description": "Maximum number of results to return (default: 5)",
-                            "default": 5
-                        }
-                    },
-                    "required": ["topic"]
-                }
-            },
-            {
-                "name": "get_available_topics",
-                "description": "Get all available topics in the knowledge base",
-                "parameters": {
-                    "type": "object",
-                    "properties": {}
-                }
-            },
-            {
-                "name": "get_knowledge_entry",
-                "description": "Get a specific knowledge entry by its ID",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "entry_id": {
-                            "type": "string",
-                            "description": "The ID of the knowledge entry to retrieve"
-                        }
-                    },
-                    "required": ["entry_id"]
-                }
-            },
-            {
-                "name": "extract_qualification_data",
-                "description": "Extract business qualification data from conversation",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "business_type": {
-                            "type": "string",
-                            "description": "Type of business: new_cafe, existing_business, or unknown"
-                        },
-                        "timeline": {
-                            "type": "string",
-                            "description": "When opening/switching (e.g., '2 weeks', 'next month', 'soon')"
-                        },
-                        "pain_points": {
-                            "type": "string",
-                            "description": "Current supplier issues or business challenges"
-                        },
-                        "business_scale": {
-                            "type": "string",
-                            "description": "Number of locations or business size"
-                        },
-                        "coffee_style": {
-                            "type": "string",
-                            "description": "Coffee preference (specialty, dark, consistent, etc.)"
-                        },
-                        "equipment_needs": {
-                            "type": "string",
-                            "description": "What equipment they need"
-                        },
-                        "volume": {
-                            "type": "string",
-                            "description": "Expected daily coffee volume"
-                        },
-                        "support_needs": {
-                            "type": "string",
-                            "description": "Training, service, menu help needed"
-                        },
-                        "contact_name": {
-                            "type": "string",
-                            "description": "Person's name"
-                        },
-                        "contact_phone": {
-                            "type": "string",
-                            "description": "Phone number"
-                        },
-                        "contact_email": {
-                            "type": "string",
-                            "description": "Email address"
-                        },
-                        "contact_role": {
-                            "type": "string",
-                            "description": "Their role/title"
-                        }
-                    },
-                    "required": ["business_type"]
-                }
-            },
-            {
-                "name": "generate_sales_handoff",
-                "description": "Generate professional sales handoff summary",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "collected_data": {
-                            "type": "object",
-                            "description": "All collected qualification data"
-                        },
-                        "conversation_summary": {
-                            "type": "string",
-                            "description": "Brief summary of key conversation points"
-                        }
-                    },
-                    "required": ["collected_data", "conversation_summary"]
-                }
-            }
-        ]
+        # A per-instance list so subclasses can add their own functions; the schema
+        # dicts themselves are shared module-level constants
+        return list(FUNCTION_SCHEMAS)
     
     def load_stored_data(self):
         """Load previously stored qualification data"""
-        try:
-            with open(self.data_file, 'r') as f:
-                self.stored_data = json.load(f)
-        except FileNotFoundError:
-            self.stored_data = {
-                "qualifications": [],
-                "last_updated": datetime.now().isoformat()
-            }
-    
-    def save_data(self):
-        """Save qualification data to file"""
-        self.stored_data["last_updated"] = datetime.now().isoformat()
-        with open(self.data_file, 'w') as f:
-            json.dump(self.stored_data, f, indent=2)
+        qualifications = load_qualifications()
+        self.stored_data = {
+            "qualifications": qualifications,
+            "last_updated": qualifications[-1].get("timestamp") if qualifications else None
+        }
     
     def store_qualification_data(self, data):
-        """Store qualification data"""
+        """Store qualification data (appended; earlier records are not rewritten)"""
         data["timestamp"] = datetime.now().isoformat()
-        self.stored_data["qualifications"].append(data)
-        self.save_data()
+        append_qualification(data)
+        self.stored_data["last_updated"] = data["timestamp"]
         return f"Qualification data stored for {data.get('contact_name', 'Unknown')}"
     
     
-    def _call_function(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
-        """Call the specified function with given arguments"""
+    def _build_embedding_index(self):
+        """Build the embedding index off the startup path"""
         try:
-            if function_name == "search_coffee_knowledge":
-                query = arguments.get("query", "")
-                max_results = arguments.get("max_results", 5)
-                min_score = arguments.get("min_score", 1.0)
-                
-                results = self.knowledge_base.search_knowledge_base(
-                    query=query,
-                    max_results=max_results,
-                    min_score=min_score
-                )
-                
-                return {
-                    "success": True,
-                    "results": [
-                        {
-                            "id": result["id"],
-                            "title": result["title"],
-                            "topic": result["topic"],
-                            "tags": result["tags"],
-                            "content_preview": result["content_raw"][:200] + "..." if len(result["content_raw"]) > 200 else result["content_raw"],
-                            "filename": result["filename"]
-                        }
-                        for result in results
-                    ],
-                    "total_found": len(results)
-                }
-            
-            elif function_name == "get_similar_knowledge":
-                entry_id = arguments.get("entry_id", "")
-                max_results = arguments.get("max_results", 3)
-                
-                similar_entries = self.knowledge_base.get_similar_entries(
-                    entry_id=entry_id,
-                    max_results=max_results
-                )
-                
-                return {
-                    "success": True,
-                    "similar_entries": [
-                        {
-                            "id": entry["id"],
-                            "title": entry["title"],
-                            "topic": entry["topic"],
-                            "tags": entry["tags"],
-                            "filename": entry["filename"]
-                        }
-                        for entry in similar_entries
-                    ]
+            self.embedding_index.build(self.knowledge_base._get_entries_cached())
+        except Exception as e:
+            self.embedding_index = None
+            print(f"⚠️ Embedding search disabled: {e}")
+        finally:
+            self._embedding_index_ready.set()
+    
+    def _embedding_search(self, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Search the knowledge base by embedding similarity; empty if nothing is close enough"""
+        self._embedding_index_ready.wait()
+        if not self.embedding_index:
+            return []
+        self.embedding_index.build(self.knowledge_base._get_entries_cached())
+        hits = self.embedding_index.search(
+            query, max_results=max_results, min_similarity=KNOWLEDGE_EMBEDDING_CONFIG["min_similarity"]
+        )
+        results = []
+        for entry_id, _ in hits:
+            entry = self.knowledge_base.get_entry_by_id(entry_id)
+            if entry:
+                results.append(entry)
+        return results
+    
+    def _search_knowledge(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """search_coffee_knowledge: embedding or keyword search over the knowledge base"""
+        query = arguments.get("query", "")
+        max_results = arguments.get("max_results", 5)
+        min_score = arguments.get("min_score", 1.0)
+        
+        results = []
+        if self.embedding_index:
+            try:
+                results = self._embedding_search(query, max_results)
+            except Exception as e:
+                print(f"⚠️ Embedding search failed, using keyword search: {e}")
+        
+        # Keyword scoring is the default and the fallback when embeddings find nothing
+        if not results:
+            results = self.knowledge_base.search_knowledge_base(
+                query=query,
+                max_results=max_results,
+                min_score=min_score
+            )
+        
+        return {
+            "success": True,
+            "results": [
+                {
+                    "id": result["id"],
+                    "title": result["title"],
+                    "topic": result["topic"],
+                    "tags": result["tags"],
+                    "content_preview": result["content_preview"],
+                    "filename": result["filename"]
                 }
-            
-            elif function_name == "search_by_topic":
-                topic = arguments.get("topic", "")
-                max_results = arguments.get("max_results", 5)
-                
-                topic_results = self.knowledge_base.search_by_topic(
-                    topic=topic,
-                    max_results=max_results
-                )
-                
-                return {
-                    "success": True,
-                    "topic": topic,
-                    "results": [
-                        {
-                            "id": result["id"],
-                            "title": result["title"],
-                            "topic": result["topic"],
-                            "tags": result["tags"],
-                            "filename": result["filename"]
-                        }
-                        for result in topic_results
-                    ],
-                    "total_found": len(topic_results)
+                for result in results
+            ],
+            "total_found": len(results)
+        }
+    
+    def _get_similar_knowledge(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """get_similar_knowledge: entries related to a given entry"""
+        entry_id = arguments.get("entry_id", "")
+        max_results = arguments.get("max_results", 3)
+        
+        similar_entries = self.knowledge_base.get_similar_entries(
+            entry_id=entry_id,
+            max_results=max_results
+        )
+        
+        return {
+            "success": True,
+            "similar_entries": [
+                {
+                    "id": entry["id"],
+                    "title": entry["title"],
+                    "topic": entry["topic"],
+                    "tags": entry["tags"],
+                    "filename": entry["filename"]
                 }
-            
-            elif function_name == "get_available_topics":
-                topics = self.knowledge_base.get_topics()
-                return {
-                    "success": True,
-                    "topics": topics,
-                    "total_topics": len(topics)
+                for entry in similar_entries
+            ]
+        }
+    
+    def _search_by_topic(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """search_by_topic: entries filed under a topic"""
+        topic = arguments.get("topic", "")
+        max_results = arguments.get("max_results", 5)
+        
+        topic_results = self.knowledge_base.search_by_topic(
+            topic=topic,
+            max_results=max_results
+        )
+        
+        return {
+            "success": True,
+            "topic": topic,
+            "results": [
+                {
+                    "id": result["id"],
+                    "title": result["title"],
+                    "topic": result["topic"],
+                    "tags": result["tags"],
+                    "filename": result["filename"]
                 }
-            
-            elif function_name == "get_knowledge_entry":
-                entry_id = arguments.get("entry_id", "")
-                entry = self.knowledge_base.get_entry_by_id(entry_id)
-                
-                if entry:
-                    return {
-                        "success": True,
-                        "entry": {
-                            "id": entry["id"],
-                            "title": entry["title"],
-                            "topic": entry["topic"],
-                            "tags": entry["tags"],
-                            "content": entry["content_raw"],
-                            "filename": entry["filename"]
-                        }
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": f"Entry with ID '{entry_id}' not found"
-                    }
-            
-            elif function_name in ["extract_qualification_data", "generate_sales_handoff"]:
-                # Use agent functions for sales qualification
-                if function_name in FUNCTION_MAP:
-                    try:
-                        # Call the async function directly
-                        import asyncio
-                        
-                        # Check if there's already an event loop running
-                        try:
-                            loop = asyncio.get_running_loop()
-                            # If we're in an async context, we need to run in a thread
-                            import concurrent.futures
-                            with concurrent.futures.ThreadPoolExecutor() as executor:
-                                future = executor.submit(asyncio.run, FUNCTION_MAP[function_name](arguments))
-                                result = future.result()
-                        except RuntimeError:
-                            # No event loop running, we can create one
-                            result = asyncio.run(FUNCTION_MAP[function_name](arguments))
-                        
-                        return result
-                    except Exception as e:
-                        return {
-                            "success": False,
-                            "error": f"Error calling {function_name}: {str(e)}"
-                        }
-                else:
-                    return {
-                        "success": False,
-                        "error": f"Function {function_name} not found in agent functions"
-                    }
-            
-            else:
-                return {
-                    "success": False,
-                    "error": f"Unknown function: {function_name}"
+                for result in topic_results
+            ],
+            "total_found": len(topic_results)
+        }
+    
+    def _get_available_topics(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """get_available_topics: every topic in the knowledge base"""
+        topics = self.knowledge_base.get_topics()
+        return {
+            "success": True,
+            "topics": topics,
+            "total_topics": len(topics)
+        }
+    
+    def _get_knowledge_entry(self, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """get_knowledge_entry: full content of one entry"""
+        entry_id = arguments.get("entry_id", "")
+        entry = self.knowledge_base.get_entry_by_id(entry_id)
+        
+        if entry:
+            return {
+                "success": True,
+                "entry": {
+                    "id": entry["id"],
+                    "title": entry["title"],
+                    "topic": entry["topic"],
+                    "tags": entry["tags"],
+                    "content": entry["content_raw"],
+                    "filename": entry["filename"]
                 }
-                
+            }
+        else:
+            return {
+                "success": False,
+                "error": f"Entry with ID '{entry_id}' not found"
+            }
+    
+    def _call_agent_function(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Sales qualification functions, implemented as async agent functions"""
+        if function_name not in FUNCTION_MAP:
+            return {
+                "success": False,
+                "error": f"Function {function_name} not found in agent functions"
+            }
+        try:
+            # Run the async agent function on the long-lived background loop
+            future = asyncio.run_coroutine_threadsafe(
+                FUNCTION_MAP[function_name](arguments), self._bg_loop
+            )
+            return future.result()
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"Error calling {function_name}: {str(e)}"
+            }
+    
+    def _build_function_dispatch(self) -> Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]]:
+        """Map each function name to the handler that implements it"""
+        dispatch = {
+            "search_coffee_knowledge": self._search_knowledge,
+            "get_similar_knowledge": self._get_similar_knowledge,
+            "search_by_topic": self._search_by_topic,
+            "get_available_topics": self._get_available_topics,
+            "get_knowledge_entry": self._get_knowledge_entry,
+        }
+        for function_name in ("extract_qualification_data", "generate_sales_handoff"):
+            dispatch[function_name] = functools.partial(self._call_agent_function, function_name)
+        return dispatch
+    
+    def _call_function(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Call the specified function with given arguments"""
+        handler = self._function_dispatch.get(function_name)
+        if handler is None:
+            return {
+                "success": False,
+                "error": f"Unknown function: {function_name}"
+            }
+        try:
+            return handler(arguments)
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Function call failed: {str(e)}"
             }
     
+    def _lookup_cached_reply(self, user_message: str, state_hash: Optional[str]) -> Optional[str]:
+        """Return a cached reply for a paraphrased repeat question, if any"""
+        if not self.response_cache:
+            return None
+        try:
+            return self.response_cache.lookup(user_message, state_hash)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            return None
+    
+    def _cache_reply(self, user_message: str, state_hash: Optional[str], reply: str,
+                     function_name: Optional[str] = None):
+        """Store a generated reply in the semantic cache"""
+        if not self.response_cache:
+            return
+        try:
+            self.response_cache.store(user_message, state_hash, reply, function_name)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+    
     def get_initial_greeting(self) -> str:
         """Get Logan's initial greeting for new conversations"""
-        from common.agent_templates import AgentTemplates
-        agent_templates = AgentTemplates(industry="coffee_business")
-        
-        system_message = SystemMessage(content=agent_templates.prompt)
-        messages = [system_message] + [HumanMessage(content="Hello")]
+        messages = [self._system_message] + [HumanMessage(content="Hello")]
         
         response = self.chat_model.invoke(messages)
         self.conversation_history.append(response)
         return response.content
+    
+    async def aget_initial_greeting(self) -> str:
+        """Async get_initial_greeting, for callers running on an event loop"""
+        messages = [self._system_message] + [HumanMessage(content="Hello")]
+        
+        response = await self._ainvoke(messages)
+        self.conversation_history.append(response)
+        return response.content
 
-    def chat_with_user(self, user_message: str) -> str:
-        """Process user message with knowledge base integration"""
+    def _get_llm_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore limiting concurrent chat model requests on the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._llm_semaphore_loop is not loop:
+            self._llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_REQUESTS)
+            self._llm_semaphore_loop = loop
+        return self._llm_semaphore
+    
+    async def _ainvoke(self, messages: list, with_functions: bool = False,
+                       on_token: Optional[Callable[[str], Any]] = None):
+        """Call the chat model asynchronously, bounded by the request semaphore
+        
+        With on_token, the completion is streamed: each content chunk is passed to on_token
+        (awaited if it is a coroutine function) as it arrives and the merged message
+        (including any function call) is returned.
+        """
+        model = self._function_model if with_functions else self.chat_model
+        async with self._get_llm_semaphore():
+            if on_token is None:
+                return await model.ainvoke(messages)
+            
+            response = None
+            async for chunk in model.astream(messages):
+                if chunk.content:
+                    result = on_token(chunk.content)
+                    if inspect.isawaitable(result):
+                        await result
+                response = chunk if response is None else response + chunk
+            if response is None:
+                return AIMessage(content="")
+            return AIMessage(content=response.content, additional_kwargs=response.additional_kwargs)
+    
+    async def _acall_function(self, function_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Run _call_function in a worker thread so the event loop keeps serving other turns"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call_function, function_name, arguments)
+    
+    async def _compact_history(self):
+        """Fold the oldest half of the turns in an over-long history into a running summary"""
+        history = self.conversation_history
+        if len(history) <= self._max_history_messages:
+            return
+        
+        # A turn starts at a user message; the greeting before the first one stays in place.
+        # Cutting at a turn start never leaves a reply without the message it answers.
+        turn_starts = [i for i, message in enumerate(history) if isinstance(message, HumanMessage)]
+        if len(turn_starts) < 2:
+            return
+        first_turn, cut = turn_starts[0], turn_starts[len(turn_starts) // 2]
+        dropped = history[first_turn:cut]
+        self.conversation_history = history[:first_turn] + history[cut:]
+        
+        transcript = "\n".join(
+            f"{'User' if isinstance(message, HumanMessage) else 'Assistant'}: {message.content}"
+            for message in dropped
+        )
+        if self._summary:
+            transcript = f"Earlier summary: {self._summary}\n{transcript}"
+        
         try:
-            # Use the proper prompt template from common folder
-            from common.agent_templates import AgentTemplates
-            agent_templates = AgentTemplates(industry="coffee_business")
+            summary = await self._ainvoke([
+                SystemMessage(content="Summarize this coffee business conversation in under 120 words. "
+                                      "Keep names, business details, needs and any commitments made."),
+                HumanMessage(content=transcript)
+            ])
+            self._summary = summary.content
+        except Exception as e:
+            # Keep the previous summary; the dropped turns are simply forgotten
+            print(f"Error summarizing conversation history: {e}")
+    
+    async def _ainvoke_with_tools(self, messages: list, on_token: Optional[Callable[[str], Any]] = None):
+        """Get a reply to messages, running a requested function and answering from its result
+        
+        Returns the reply message and the name of the function that was called, if any.
+        """
+        response = await self._ainvoke(messages, with_functions=True, on_token=on_token)
+        function_call = response.additional_kwargs.get('function_call')
+        if not function_call:
+            return response, None
+        
+        function_name = function_call['name']
+        function_args = json.loads(function_call['arguments'])
+        function_result = await self._acall_function(function_name, function_args)
+        
+        # Answer again with the function result appended to the conversation
+        function_message = AIMessage(content=f"Function call result: {_compact_json(function_result)}")
+        final_response = await self._ainvoke(messages + [function_message], on_token=on_token)
+        return final_response, function_name
+    
+    def _build_messages(self, user_message: str) -> list:
+        """Prompt for a turn: system message, summary of older turns (if any), history, user message"""
+        messages = [self._system_message]
+        if self._summary:
+            messages.append(SystemMessage(content=f"Prior context: {self._summary}"))
+        messages.extend(self.conversation_history)
+        messages.append(HumanMessage(content=user_message))
+        return messages
+    
+    async def achat_with_user(self, user_message: str,
+                              on_token: Optional[Callable[[str], Any]] = None) -> str:
+        """Process user message with knowledge base integration without blocking the event loop
+        
+        If on_token is given, reply tokens are streamed to it as they are generated; the full
+        reply is still returned.
+        """
+        try:
+            # Keep the prompt size bounded on long conversations
+            await self._compact_history()
             
-            # Check if this is the first message in the conversation
-            if not self.conversation_history:
-                # This is the first message - use the prompt template for proper greeting
-                system_message = SystemMessage(content=agent_templates.prompt)
-                messages = [system_message] + [HumanMessage(content=user_message)]
-                
-                # Get response with function calling
-                response = self.chat_model.invoke(
-                    messages,
-                    functions=self.functions,
-                    function_call="auto"
+            # Answer paraphrased repeats of an opening question from the semantic cache; the
+            # lookup (and the store below) may call the embeddings API, so they run off the loop
+            loop = asyncio.get_running_loop()
+            state_hash = None
+            cached_reply = None
+            if self.response_cache:
+                state_hash = cache_state_key(
+                    self.conversation_history, self._summary, self.knowledge_base.get_version()
                 )
-                
-                # Handle function calling if needed
-                if hasattr(response, 'additional_kwargs') and 'function_call' in response.additional_kwargs:
-                    function_call = response.additional_kwargs['function_call']
-                    function_name = function_call['name']
-                    function_args = json.loads(function_call['arguments'])
-                    
-                    # Call the function
-                    function_result = self._call_function(function_name, function_args)
-                else:
-                    # No function calling needed, return direct response
-                    self.conversation_history.append(HumanMessage(content=user_message))
-                    self.conversation_history.append(response)
-                    return response.content
-                
-                # Add function result to conversation
-                function_message = AIMessage(
-                    content=f"Function call result: {json.dumps(function_result, indent=2)}"
+            if state_hash is not None:
+                cached_reply = await loop.run_in_executor(
+                    self._executor, self._lookup_cached_reply, user_message, state_hash
                 )
-                messages.append(function_message)
-                
-                # Get final response with function results (include system message)
-                final_response = self.chat_model.invoke([system_message] + messages[1:])
-                
-                # Add both messages to conversation history
+            if cached_reply is not None:
                 self.conversation_history.append(HumanMessage(content=user_message))
-                self.conversation_history.append(final_response)
-                
-                return final_response.content
+                self.conversation_history.append(AIMessage(content=cached_reply))
+                return cached_reply
             
-            system_message = SystemMessage(content=agent_templates.prompt)
+            messages = self._build_messages(user_message)
             
+            reply, function_name = await self._ainvoke_with_tools(messages, on_token=on_token)
             
-            # Prepare messages for function calling
-            messages = [system_message] + self.conversation_history + [HumanMessage(content=user_message)]
-            
-            # Get response with function calling
-            response = self.chat_model.invoke(
-                messages,
-                functions=self.functions,
-                function_call="auto"
-            )
-            
-            # Check if function calling is needed
-            if hasattr(response, 'additional_kwargs') and 'function_call' in response.additional_kwargs:
-                function_call = response.additional_kwargs['function_call']
-                function_name = function_call['name']
-                function_args = json.loads(function_call['arguments'])
-                
-                # Call the function
-                function_result = self._call_function(function_name, function_args)
-                
-                # Add function result to conversation
-                function_message = AIMessage(
-                    content=f"Function call result: {json.dumps(function_result, indent=2)}"
+            self.conversation_history.append(HumanMessage(content=user_message))
+            self.conversation_history.append(reply)
+            if state_hash is not None:
+                # Not awaited: storing never delays the reply (_cache_reply handles its own errors)
+                loop.run_in_executor(
+                    self._executor, self._cache_reply, user_message, state_hash, reply.content, function_name
                 )
-                messages.append(function_message)
-                
-                # Get final response with function results (include system message)
-                final_response = self.chat_model.invoke([system_message] + messages[1:])
-                
-                # Add both messages to conversation history
-                self.conversation_history.append(HumanMessage(content=user_message))
-                self.conversation_history.append(final_response)
-                
-                return final_response.content
-            else:
-                # No function calling needed, return direct response
-                self.conversation_history.append(HumanMessage(content=user_message))
-                self.conversation_history.append(response)
-                
-                return response.content
-                
+            
+            return reply.content
+        
         except Exception as e:
-            print(f"Error in chat_with_user: {str(e)}")
+            print(f"Error in achat_with_user: {str(e)}")
             return f"I apologize, but I encountered an error: {str(e)}"
     
+    def chat_with_user(self, user_message: str, on_token: Optional[Callable[[str], Any]] = None) -> str:
+        """Synchronous wrapper around achat_with_user for the CLI
+        
+        Every turn runs on the same long-lived background loop: the chat model's async HTTP
+        client pools connections on the loop that opened them, so a fresh loop per turn
+        (asyncio.run) would hand it connections from a closed loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.achat_with_user(user_message, on_token=on_token), self._bg_loop
+        )
+        return future.result()
+    
+    def close(self):
+        """Stop the worker thread pool and the background event loop"""
+        self._executor.shutdown(wait=False)
+        if self._bg_loop.is_closed():
+            return
+        self._bg_loop.call_soon_threadsafe(self._bg_loop.stop)
+        self._bg_loop_thread.join(timeout=5)
+        if not self._bg_loop_thread.is_alive():
+            self._bg_loop.close()
+    
     def start_chat(self):
         """Start the interactive chat session"""
         print("🤖 Coffee Business Knowledge Chatbot")
@@ -527,7 +745,7 @@ class KnowledgeBasedChatBot:
                 user_input = input("\n👤 You: ").strip()
                 
                 # Check for exit commands
-                if user_input.lower() in ['quit', 'exit', 'bye', 'q']:
+                if user_input.lower() in EXIT_COMMANDS:
                     print("\n👋 Thanks for chatting! Goodbye!")
                     break
                 
@@ -544,10 +762,23 @@ class KnowledgeBasedChatBot:
                     print("💭 Please enter a message.")
                     continue
                 
-                # Process the message
+                # Process the message, printing reply tokens as they stream in
                 print("\n🤖 AI: ", end="", flush=True)
-                response = self.chat_with_user(user_input)
-                print(response)
+                streamed = []
+                
+                def show_token(token: str):
+                    streamed.append(token)
+                    print(token, end="", flush=True)
+                
+                response = self.chat_with_user(user_input, on_token=show_token)
+                if not streamed:
+                    # Cached replies and error messages are not streamed; print them whole
+                    print(response)
+                elif not "".join(streamed).endswith(response):
+                    # Streaming stopped part-way (e.g. an error after some tokens): show the returned message
+                    print(f"\n{response}")
+                else:
+                    print()
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Chat interrupted. Goodbye!")
@@ -560,10 +791,13 @@ def main():
     """Main entry point"""
     try:
         chatbot = KnowledgeBasedChatBot()
-        chatbot.start_chat()
     except Exception as e:
         print(f"❌ Failed to start chatbot: {e}")
         sys.exit(1)
+    try:
+        chatbot.start_chat()
+    finally:
+        chatbot.close()
 
 if __name__ == "__main__":
     main()
@@ -4,17 +4,23 @@ Pytest configuration and fixtures for Coffee Business AI Chatbot tests.
 
 import pytest
 import os
-import tempfile
+import sys
 import json
-from unittest.mock import Mock, patch
+import importlib.util
+from types import SimpleNamespace
+from contextlib import ExitStack
+from unittest.mock import AsyncMock, Mock, patch
 from typing import Dict, Any
 
 # Set test environment variables
 os.environ["OPENAI_API_KEY"] = "test_key"
 os.environ["DEBUG"] = "true"
 
+# The constant sample-data fixtures below are session-scoped and shared between tests;
+# copy (e.g. copy.deepcopy) before mutating them in a test.
 
-@pytest.fixture
+
+@pytest.fixture(scope="session")
 def mock_openai_response():
     """Mock OpenAI API response."""
     return {
@@ -29,7 +35,7 @@ def mock_openai_response():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_customer_data():
     """Sample customer data for testing."""
     return {
@@ -42,7 +48,7 @@ def sample_customer_data():
     }
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_qualification_data():
     """Sample sales qualification data for testing."""
     return {
@@ -65,17 +71,11 @@ def sample_qualification_data():
 
 
 @pytest.fixture
-def temp_data_file():
-    """Create a temporary data file for testing."""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as f:
-        json.dump({"test": "data"}, f)
-        temp_file = f.name
-    
-    yield temp_file
-    
-    # Cleanup
-    if os.path.exists(temp_file):
-        os.unlink(temp_file)
+def temp_data_file(tmp_path):
+    """Create a temporary data file for testing (removed by pytest's tmp_path cleanup)."""
+    data_file = tmp_path / "data.json"
+    data_file.write_text(json.dumps({"test": "data"}))
+    return str(data_file)
 
 
 @pytest.fixture
@@ -87,7 +87,7 @@ def mock_websocket():
     return websocket
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def mock_knowledge_base():
     """Mock knowledge base data."""
     return {
@@ -106,12 +106,30 @@ def mock_knowledge_base():
     }
 
 
-@pytest.fixture(autouse=True)
+def _module_available(name: str) -> bool:
+    """Whether an optional dependency can be imported (patch() needs the target module)."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+@pytest.fixture(scope="session", autouse=True)
 def mock_external_apis():
-    """Mock external API calls to prevent actual API requests during testing."""
-    with patch('openai.ChatCompletion.create') as mock_openai, \
-         patch('google.auth.default') as mock_google_auth, \
-         patch('googleapiclient.discovery.build') as mock_google_build:
+    """Mock external API calls to prevent actual API requests during testing.
+    
+    Patched once for the whole session; mock_external_apis_reset clears call history per test.
+    """
+    with ExitStack() as stack:
+        mock_openai = stack.enter_context(patch('openai.ChatCompletion.create'))
+        
+        # Google integrations are optional dependencies; only patch them when installed
+        mock_google_auth = None
+        mock_google_build = None
+        if _module_available('google.auth'):
+            mock_google_auth = stack.enter_context(patch('google.auth.default'))
+        if _module_available('googleapiclient.discovery'):
+            mock_google_build = stack.enter_context(patch('googleapiclient.discovery.build'))
         
         # Mock OpenAI response
         mock_openai.return_value = {
@@ -126,8 +144,10 @@ def mock_external_apis():
         }
         
         # Mock Google API authentication
-        mock_google_auth.return_value = (Mock(), "test-project")
-        mock_google_build.return_value = Mock()
+        if mock_google_auth is not None:
+            mock_google_auth.return_value = (Mock(), "test-project")
+        if mock_google_build is not None:
+            mock_google_build.return_value = Mock()
         
         yield {
             'openai': mock_openai,
@@ -136,28 +156,53 @@ def mock_external_apis():
         }
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def mock_external_apis_reset(mock_external_apis):
+    """Clear recorded calls on the session-wide API mocks before each test."""
+    for mock in mock_external_apis.values():
+        if mock is not None:
+            mock.reset_mock()
+    yield mock_external_apis
+
+
+@pytest.fixture(scope="session")
 def client():
-    """FastAPI test client."""
+    """FastAPI test client for the web app; its lifespan (chatbot startup) runs once per session."""
     from fastapi.testclient import TestClient
     
     # Import here to avoid circular imports
-    try:
-        from web_knowledge_chatbot import app
-        return TestClient(app)
-    except ImportError:
-        # If the main app isn't available, create a minimal test app
-        from fastapi import FastAPI
-        test_app = FastAPI()
-        
-        @test_app.get("/health")
-        async def health():
-            return {"status": "ok"}
-        
-        return TestClient(test_app)
+    from web_knowledge_chatbot import app
+    with TestClient(app) as test_client:
+        yield test_client
 
 
 @pytest.fixture
+def minimal_client():
+    """FastAPI test client for a minimal app exposing only /health."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    
+    test_app = FastAPI()
+    
+    @test_app.get("/health")
+    async def health():
+        return {"status": "ok"}
+    
+    return TestClient(test_app)
+
+
+@pytest.fixture(autouse=True)
+def reset_chatbot_state():
+    """Give each test a fresh conversation on the shared web chatbot, if it has been loaded."""
+    yield
+    web_module = sys.modules.get("web_knowledge_chatbot")
+    chatbot = getattr(web_module.app.state, "chatbot", None) if web_module else None
+    if chatbot is not None:
+        chatbot.conversation_history.clear()
+        chatbot._summary = None
+
+
+@pytest.fixture(scope="session")
 def sample_conversation_history():
     """Sample conversation history for testing."""
     return [
@@ -168,26 +213,11 @@ def sample_conversation_history():
     ]
 
 
-class MockAsyncContextManager:
-    """Mock async context manager for testing."""
-    
-    def __init__(self, return_value):
-        self.return_value = return_value
-    
-    async def __aenter__(self):
-        return self.return_value
-    
-    async def __aexit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-
 @pytest.fixture
 def mock_async_openai():
     """Mock async OpenAI client for testing."""
-    mock_client = Mock()
-    mock_response = Mock()
-    mock_response.choices = [
-        Mock(message=Mock(content="Test response", role="assistant"))
-    ]
-    mock_client.chat.completions.create.return_value = MockAsyncContextManager(mock_response)
+    mock_client = AsyncMock()
+    mock_client.chat.completions.create.return_value = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Test response", role="assistant"))]
+    )
     return mock_client
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Tests for sales qualification storage (NDJSON data file).
+"""
+
+import json
+
+import pytest
+
+from common import business_logic
+
+
+@pytest.fixture
+def qualification_storage(tmp_path, monkeypatch):
+    """Run storage functions against an empty working directory with a cold in-memory copy."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(business_logic, "_qualifications", None)
+    monkeypatch.setattr(business_logic, "_qualifications_signature", None)
+    return tmp_path
+
+
+def read_data_file(directory):
+    lines = (directory / business_logic.SALES_DATA_FILE).read_text().splitlines()
+    return [json.loads(line) for line in lines]
+
+
+def test_legacy_json_file_is_migrated(qualification_storage):
+    legacy = {"qualifications": [{"contact_name": "Ada"}, {"contact_name": "Grace"}]}
+    (qualification_storage / business_logic.LEGACY_SALES_DATA_FILE).write_text(json.dumps(legacy))
+
+    records = business_logic.load_qualifications()
+
+    assert [record["contact_name"] for record in records] == ["Ada", "Grace"]
+    assert read_data_file(qualification_storage) == legacy["qualifications"]
+
+
+def test_append_then_load(qualification_storage):
+    assert business_logic.load_qualifications() == []
+
+    business_logic.append_qualification({"contact_name": "Ada", "lead_score": 80})
+    business_logic.append_qualification({"contact_name": "Grace", "lead_score": 40})
+
+    expected = [{"contact_name": "Ada", "lead_score": 80}, {"contact_name": "Grace", "lead_score": 40}]
+    assert business_logic.load_qualifications() == expected
+    assert read_data_file(qualification_storage) == expected
+
+
+def test_records_appended_by_another_process_are_seen(qualification_storage):
+    business_logic.append_qualification({"contact_name": "Ada"})
+    assert len(business_logic.load_qualifications()) == 1
+
+    # Another worker appends to the same file
+    with open(qualification_storage / business_logic.SALES_DATA_FILE, "a") as f:
+        f.write(json.dumps({"contact_name": "Grace"}) + "\n")
+
+    assert [record["contact_name"] for record in business_logic.load_qualifications()] == ["Ada", "Grace"]
+
+    business_logic.append_qualification({"contact_name": "Linus"})
+    assert [record["contact_name"] for record in business_logic.load_qualifications()] == ["Ada", "Grace", "Linus"]
@@ -0,0 +1,101 @@
+"""
+Tests for the semantic response cache.
+"""
+
+import time
+
+import pytest
+from langchain.schema import AIMessage, HumanMessage
+
+from common.semantic_cache import SemanticResponseCache, cache_state_key, content_tokens
+
+VOCABULARY = ("improve", "boost", "sales", "espresso", "machine", "buy", "menu", "pricing", "order")
+
+
+class FakeEmbeddings:
+    """Bag-of-words vectors over a small vocabulary; counts embedding requests."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_query(self, text):
+        self.calls += 1
+        tokens = content_tokens(text)
+        return [1.0 if word in tokens else 0.0 for word in VOCABULARY] + [0.01]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    response_cache = SemanticResponseCache(api_key="test-key", db_path=str(tmp_path / "cache.db"))
+    response_cache.embeddings = FakeEmbeddings()
+    return response_cache
+
+
+GREETING = AIMessage(content="Hi, I'm Logan!")
+OPENER = cache_state_key([GREETING], None, "kb-v1")
+
+
+def test_paraphrase_in_same_state_hits(cache):
+    cache.store("How do I improve sales?", OPENER, "Upsell pastries.")
+
+    assert cache.lookup("How can I improve my sales?", OPENER) == "Upsell pastries."
+
+
+def test_different_question_misses(cache):
+    cache.store("How do I improve sales?", OPENER, "Upsell pastries.")
+
+    assert cache.lookup("Which espresso machine should I buy?", OPENER) is None
+
+
+def test_knowledge_base_change_misses(cache):
+    cache.store("How do I improve sales?", OPENER, "Upsell pastries.")
+    updated_knowledge = cache_state_key([GREETING], None, "kb-v2")
+
+    assert cache.lookup("How do I improve sales?", updated_knowledge) is None
+
+
+def test_expired_replies_miss(cache, monkeypatch):
+    cache.store("How do I improve sales?", OPENER, "Upsell pastries.")
+    stored_at = time.time()
+    monkeypatch.setattr(time, "time", lambda: stored_at + cache.ttl_seconds + 1)
+
+    assert cache.lookup("How can I improve my sales?", OPENER) is None
+
+
+def test_customer_specific_messages_are_not_cached(cache):
+    cache.store("What is the status of my order?", OPENER, "It shipped.")
+
+    assert cache.lookup("What is the status of my order?", OPENER) is None
+    assert cache.embeddings.calls == 0
+
+
+def test_replies_from_non_knowledge_functions_are_not_stored(cache):
+    cache.store("How do I improve sales?", OPENER, "Lead saved.", function_name="extract_qualification_data")
+    cache.store("How do I improve menu pricing?", OPENER, "Use anchors.", function_name="search_coffee_knowledge")
+
+    assert cache.lookup("How do I improve sales?", OPENER) is None
+    assert cache.lookup("How can I improve my menu pricing?", OPENER) == "Use anchors."
+
+
+def test_stored_replies_survive_a_restart(cache, tmp_path):
+    cache.store("How do I improve sales?", OPENER, "Upsell pastries.")
+
+    reloaded = SemanticResponseCache(api_key="test-key", db_path=str(tmp_path / "cache.db"))
+    reloaded.embeddings = FakeEmbeddings()
+
+    assert reloaded.lookup("How can I improve my sales?", OPENER) == "Upsell pastries."
+
+
+def test_only_opening_questions_have_a_state_key():
+    assert OPENER is not None
+    assert cache_state_key([], None, "kb-v1") == OPENER
+    assert cache_state_key([GREETING, HumanMessage(content="thanks"), AIMessage(content="You're welcome!")],
+                           None, "kb-v1") is None
+    assert cache_state_key([GREETING], "Ada runs a cafe in Denver.", "kb-v1") is None
+
+
+def test_uncacheable_state_is_neither_stored_nor_looked_up(cache):
+    cache.store("How do I improve sales?", None, "Ada, upsell pastries at your Denver cafe.")
+
+    assert cache.lookup("How do I improve sales?", None) is None
+    assert cache.embeddings.calls == 0
@@ -5,17 +5,21 @@ Web interface for the coffee knowledge base chatbot with real-time function call
 """
 
 import os
+import re
 import json
 import time
 import asyncio
-from typing import List, Dict, Any
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from typing import Dict, Any, Optional, Set
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
+from langchain.schema import HumanMessage, AIMessage
+from dotenv import load_dotenv
 import uvicorn
 
 # Import the knowledge-based chatbot
-from knowledge_based_chatbot import KnowledgeBasedChatBot
+from knowledge_based_chatbot import KnowledgeBasedChatBot, EXIT_COMMANDS, _compact_json
 
 # Import common function definitions and business logic
 from common.agent_functions import FUNCTION_DEFINITIONS, FUNCTION_MAP
@@ -31,19 +35,78 @@ from common.business_logic import (
     handle_meeting_scheduling_request,
     complete_meeting_scheduling
 )
-from common.agent_templates import AgentTemplates
 from common.prompt_templates import COFFEE_BUSINESS_PROMPT_TEMPLATE
 
+# Sentence boundary: whitespace after terminal punctuation (decimals and URLs stay intact)
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+')
+
+# Optional pause between streamed sentences, in seconds (0 sends them as fast as possible)
+STREAM_SENTENCE_DELAY = float(os.getenv("STREAM_SENTENCE_DELAY", "0"))
+
+
+def _timestamped_template(payload: Dict[str, Any]) -> str:
+    """Serialize a fixed message once, leaving a %r slot for its metadata timestamp"""
+    body = json.dumps({**payload, "metadata": {"timestamp": 0.0}}).replace('%', '%%')
+    return body.replace('"timestamp": 0.0', '"timestamp": %r')
+
+
+# Messages whose only varying field is the timestamp, serialized at import
+TYPING_TEMPLATE = _timestamped_template({"type": "ai_typing", "content": ""})
+GOODBYE_TEMPLATE = _timestamped_template({"type": "session_end", "content": "👋 Thanks for chatting! Goodbye!"})
+EMPTY_MESSAGE_TEMPLATE = _timestamped_template({"type": "error", "content": "💭 Please enter a message."})
+
+class SentenceStream:
+    """Collects streamed reply tokens and sends each completed sentence as an ai_chunk"""
+    
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.buffer = ""
+        self.chunk_index = 0
+    
+    async def feed(self, token: str):
+        """Add a token; send any sentences it completes"""
+        self.buffer += token
+        *sentences, self.buffer = _SENTENCE_BOUNDARY_RE.split(self.buffer)
+        if sentences:
+            # Sentences completed by the same token share one timestamp
+            timestamp = time.time()
+            for sentence in sentences:
+                await self._send(sentence, timestamp)
+    
+    async def flush(self):
+        """Send whatever is left once the completion has finished"""
+        remainder, self.buffer = self.buffer, ""
+        await self._send(remainder, time.time())
+    
+    async def _send(self, sentence: str, timestamp: float):
+        # Skip empty sentences
+        if not sentence.strip():
+            return
+        
+        chunk_data = {
+            "type": "ai_chunk",
+            "content": sentence + " ",
+            "metadata": {
+                "timestamp": timestamp,
+                "chunk_index": self.chunk_index,
+                "is_sentence": True
+            }
+        }
+        self.chunk_index += 1
+        await self.websocket.send_text(json.dumps(chunk_data))
+        
+        # Optional delay between sentences for a natural reading pace
+        if STREAM_SENTENCE_DELAY > 0:
+            await asyncio.sleep(STREAM_SENTENCE_DELAY)
+
+
 class WebKnowledgeChatBot(KnowledgeBasedChatBot):
     """Web-based knowledge chatbot with WebSocket support"""
     
     def __init__(self):
         """Initialize the web knowledge chatbot"""
         super().__init__()
-        self.active_connections: List[WebSocket] = []
-        
-        # Initialize agent templates for better prompt handling
-        self.agent_templates = AgentTemplates(industry="coffee_business")
+        self.active_connections: Set[WebSocket] = set()
         
         # Add customer service functions to existing functions
         self.functions.extend(FUNCTION_DEFINITIONS)
@@ -62,17 +125,34 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
             # New customer service functions
             **FUNCTION_MAP
         }
+        
+        # Greeting generated by the model on the first connection and reused afterwards
+        self._initial_greeting: Optional[str] = None
+        
+        # Which customer service functions are coroutines, resolved once instead of per call
+        self._async_functions = frozenset(
+            name for name, func in FUNCTION_MAP.items() if asyncio.iscoroutinefunction(func)
+        )
+    
+    async def aget_initial_greeting(self) -> str:
+        """Initial greeting for a new connection; generated once, then reused"""
+        if self._initial_greeting is None:
+            self._initial_greeting = await super().aget_initial_greeting()
+        else:
+            self.conversation_history.append(AIMessage(content=self._initial_greeting))
+        return self._initial_greeting
     
     async def connect_websocket(self, websocket: WebSocket):
         """Accept and store WebSocket connection"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
         
         # Send welcome message using agent templates
+        entry_count = self.knowledge_base.get_entry_count()
         welcome_data = {
             "type": "system_message",
             "content": self.agent_templates.first_message + "\n\n" +
-                      f"📚 Knowledge base loaded with {len(self.knowledge_base._get_entries_cached())} entries\n" +
+                      f"📚 Knowledge base loaded with {entry_count} entries\n" +
                       f"🔧 {self.agent_templates.capabilities}\n\n" +
                       "I can help with:\n" +
                       "• Coffee business strategies and operations\n" +
@@ -83,7 +163,7 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
                       "• Order tracking and more!",
             "metadata": {
                 "timestamp": time.time(),
-                "knowledge_base_entries": len(self.knowledge_base._get_entries_cached()),
+                "knowledge_base_entries": entry_count,
                 "available_functions": len(self.functions),
                 "personality": self.agent_templates.personality
             }
@@ -92,34 +172,31 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
     
     def disconnect_websocket(self, websocket: WebSocket):
         """Remove WebSocket connection"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
     
     def check_exit_command(self, message: str) -> bool:
         """Check if message is an exit command"""
-        return message.lower().strip() in ['quit', 'exit', 'bye', 'q']
+        return message.lower().strip() in EXIT_COMMANDS
     
     async def handle_chat_message(self, message: str, websocket: WebSocket):
         """Process chat message with knowledge base integration"""
         try:
+            # Normalize once for the command checks below
+            command = message.strip().lower()
+            
             # Check for exit commands
-            if self.check_exit_command(message):
+            if command in EXIT_COMMANDS:
                 await self.handle_exit_command(websocket)
                 return
             
             # Check for topics command
-            if message.lower().strip() == 'topics':
+            if command == 'topics':
                 await self.handle_topics_command(websocket)
                 return
             
             # Skip empty messages
-            if not message.strip():
-                error_data = {
-                    "type": "error",
-                    "content": "💭 Please enter a message.",
-                    "metadata": {"timestamp": time.time()}
-                }
-                await websocket.send_text(json.dumps(error_data))
+            if not command:
+                await websocket.send_text(EMPTY_MESSAGE_TEMPLATE % time.time())
                 return
             
             # Process with knowledge base
@@ -147,55 +224,42 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
     
     async def handle_exit_command(self, websocket: WebSocket):
         """Handle exit command and send goodbye message"""
-        goodbye_data = {
-            "type": "session_end",
-            "content": "👋 Thanks for chatting! Goodbye!",
-            "metadata": {"timestamp": time.time()}
-        }
-        await websocket.send_text(json.dumps(goodbye_data))
+        await websocket.send_text(GOODBYE_TEMPLATE % time.time())
     
     async def process_knowledge_message(self, user_message: str, websocket: WebSocket):
         """Process message with knowledge base integration and stream response"""
-        from langchain.schema import HumanMessage, AIMessage, SystemMessage
-        
-        start_time = time.time()
+        # Sample the clock once per step; re-sample only after awaited model or function calls
+        start_time = now = time.time()
         
         try:
             # Send typing indicator
-            typing_data = {
-                "type": "ai_typing",
-                "content": "",
-                "metadata": {"timestamp": time.time()}
-            }
-            await websocket.send_text(json.dumps(typing_data))
+            await websocket.send_text(TYPING_TEMPLATE % now)
             
             # No special greeting handling needed - let the normal flow handle all messages
             
-            # Use the comprehensive prompt template from common folder
-            system_message = SystemMessage(content=self.agent_templates.prompt)
+            # Keep the prompt size bounded on long conversations
+            await self._compact_history()
             
-            # Prepare messages for function calling
-            messages = [system_message] + self.conversation_history + [HumanMessage(content=user_message)]
+            # Prepare messages for function calling (prebuilt system prompt, summary, recent turns)
+            messages = self._build_messages(user_message)
             
-            # Get response with function calling
-            response = self.chat_model.invoke(
-                messages,
-                functions=self.functions,
-                function_call="auto"
-            )
+            # Stream the response with function calling; sentences are sent as they complete
+            stream = SentenceStream(websocket)
+            response = await self._ainvoke(messages, with_functions=True, on_token=stream.feed)
             
             # Check if function calling is needed
             if hasattr(response, 'additional_kwargs') and 'function_call' in response.additional_kwargs:
                 function_call = response.additional_kwargs['function_call']
                 function_name = function_call['name']
                 function_args = json.loads(function_call['arguments'])
+                now = time.time()
                 
                 # Send function call notification
                 function_notification = {
                     "type": "function_call",
                     "content": f"🔍 Processing request: {function_name}",
                     "metadata": {
-                        "timestamp": time.time(),
+                        "timestamp": now,
                         "function_name": function_name,
                         "function_args": function_args
                     }
@@ -205,50 +269,53 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
                 # Call the appropriate function
                 function_result = await self._call_enhanced_function(function_name, function_args, websocket)
                 
+                # Serialize the result once: the client gets it as a JSON string field and
+                # the same string is given to the model
+                result_json = _compact_json(function_result)
+                
                 # Send function result
                 function_result_data = {
                     "type": "function_result",
                     "content": f"✅ Function completed: {function_name}",
                     "metadata": {
                         "timestamp": time.time(),
-                        "function_result": function_result
+                        "function_result_json": result_json
                     }
                 }
                 await websocket.send_text(json.dumps(function_result_data))
                 
                 # Add function result to conversation
                 function_message = AIMessage(
-                    content=f"Function call result: {json.dumps(function_result, indent=2)}"
+                    content=f"Function call result: {result_json}"
                 )
                 messages.append(function_message)
                 
-                # Get final response with function results
-                final_response = self.chat_model.invoke(messages)
-                
-                # Stream the final response
-                await self.stream_response_content(final_response.content, websocket)
+                # Stream the final response with function results
+                final_response = await self._ainvoke(messages, on_token=stream.feed)
+                await stream.flush()
                 
                 # Add both messages to conversation history
                 self.conversation_history.append(HumanMessage(content=user_message))
                 self.conversation_history.append(final_response)
                 
             else:
-                # No function calling needed, stream direct response
-                await self.stream_response_content(response.content, websocket)
+                # No function calling needed; the direct response has been streamed
+                await stream.flush()
                 
                 # Add both messages to conversation history
                 self.conversation_history.append(HumanMessage(content=user_message))
                 self.conversation_history.append(response)
             
             # Calculate metrics
-            response_time = time.time() - start_time
+            now = time.time()
+            response_time = now - start_time
             
             # Send completion signal
             complete_data = {
                 "type": "ai_complete",
                 "content": "",
                 "metadata": {
-                    "timestamp": time.time(),
+                    "timestamp": now,
                     "response_time": response_time
                 }
             }
@@ -282,34 +349,6 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
             }
             await websocket.send_text(json.dumps(error_data))
     
-    async def stream_response_content(self, content: str, websocket: WebSocket):
-        """Stream response content in sentence chunks"""
-        # Split content into sentences for more natural chunking
-        sentences = content.split('. ')
-        
-        for i, sentence in enumerate(sentences):
-            # Clean up the sentence
-            if not sentence.endswith('.') and i < len(sentences) - 1:
-                sentence += '.'
-            
-            # Skip empty sentences
-            if not sentence.strip():
-                continue
-            
-            chunk_data = {
-                "type": "ai_chunk",
-                "content": sentence + " ",
-                "metadata": {
-                    "timestamp": time.time(),
-                    "chunk_index": i,
-                    "is_sentence": True
-                }
-            }
-            await websocket.send_text(json.dumps(chunk_data))
-            
-            # Delay between sentences for natural reading pace
-            await asyncio.sleep(0.3)
-    
     async def _call_enhanced_function(self, function_name: str, arguments: Dict[str, Any], websocket: WebSocket) -> Dict[str, Any]:
         """Call the appropriate function (knowledge base or customer service)"""
         try:
@@ -317,14 +356,14 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
             if function_name in FUNCTION_MAP:
                 # Call customer service function
                 function_func = FUNCTION_MAP[function_name]
-                if asyncio.iscoroutinefunction(function_func):
+                if function_name in self._async_functions:
                     result = await function_func(arguments)
                 else:
                     result = function_func(arguments)
                 return result
             else:
-                # Call knowledge base function
-                return self._call_function(function_name, arguments)
+                # Call knowledge base function in a worker thread (searches can block)
+                return await self._acall_function(function_name, arguments)
                 
         except Exception as e:
             return {
@@ -332,11 +371,18 @@ class WebKnowledgeChatBot(KnowledgeBasedChatBot):
                 "error": f"Function call failed: {str(e)}"
             }
 
-# Initialize the web knowledge chatbot
-web_knowledge_chatbot = WebKnowledgeChatBot()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the web knowledge chatbot once per worker process, at startup"""
+    app.state.chatbot = WebKnowledgeChatBot()
+    try:
+        yield
+    finally:
+        # Stop the chatbot's worker threads on shutdown (and on every auto-reload)
+        app.state.chatbot.close()
 
 # Create FastAPI app
-app = FastAPI(title="Coffee Knowledge Chatbot", version="1.0.0")
+app = FastAPI(title="Coffee Knowledge Chatbot", version="1.0.0", lifespan=lifespan)
 
 # Mount static files
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -347,27 +393,29 @@ async def serve_index():
     return FileResponse("static/index.html")
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
+    web_knowledge_chatbot = request.app.state.chatbot
     return {
         "status": "healthy",
-        "knowledge_base_entries": len(web_knowledge_chatbot.knowledge_base._get_entries_cached()),
+        "knowledge_base_entries": web_knowledge_chatbot.knowledge_base.get_entry_count(),
         "available_functions": len(web_knowledge_chatbot.functions),
         "timestamp": time.time()
     }
 
 @app.get("/api/topics")
-async def get_topics():
+async def get_topics(request: Request):
     """Get available knowledge topics"""
-    topics = web_knowledge_chatbot.knowledge_base.get_topics()
+    topics = request.app.state.chatbot.knowledge_base.get_topics()
     return {
         "topics": topics,
         "total_topics": len(topics)
     }
 
 @app.get("/api/functions")
-async def get_functions():
+async def get_functions(request: Request):
     """Get available functions"""
+    web_knowledge_chatbot = request.app.state.chatbot
     return {
         "functions": [func["name"] for func in web_knowledge_chatbot.functions],
         "total_functions": len(web_knowledge_chatbot.functions)
@@ -404,11 +452,12 @@ async def get_customer_orders_endpoint(customer_id: str):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time knowledge-based chat"""
+    web_knowledge_chatbot = websocket.app.state.chatbot
     await web_knowledge_chatbot.connect_websocket(websocket)
     
     # Send initial greeting from Logan
     try:
-        initial_greeting = web_knowledge_chatbot.get_initial_greeting()
+        initial_greeting = await web_knowledge_chatbot.aget_initial_greeting()
         greeting_data = {
             "type": "ai_message",
             "content": initial_greeting,
@@ -434,5 +483,18 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"WebSocket error: {e}")
         web_knowledge_chatbot.disconnect_websocket(websocket)
 
+def main():
+    """Run the web server (auto-reload only when DEBUG=true)"""
+    load_dotenv()
+    debug = os.getenv("DEBUG", "false").lower() == "true"
+    uvicorn.run(
+        "web_knowledge_chatbot:app",
+        host=os.getenv("APP_HOST", "0.0.0.0"),
+        port=int(os.getenv("APP_PORT", "8000")),
+        reload=debug,
+        # Each worker process loads its own chatbot and knowledge base
+        workers=1 if debug else int(os.getenv("APP_WORKERS", "1")),
+    )
+
 if __name__ == "__main__":
-    uvicorn.run("web_knowledge_chatbot:app", host="0.0.0.0", port=8000, reload=True)
+    main()